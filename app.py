@@ -1,26 +1,59 @@
+import os
+
 import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from dotenv import dotenv_values
-from openai import OpenAI, AuthenticationError
-from hashlib import md5
-from pydub import AudioSegment
-import tempfile
-from io import BytesIO
+from openai import AuthenticationError
 
 import youtube_utils 
 import audio_utils 
 import summary
+import openai_utils
+import media_utils
+import metrics
+import jobs
+import search
 from translation import t
+from transcript import Transcript, format_mmss
 
 
-MODEL = "gpt-4o"
-
 env = dotenv_values(".env")
+PARTIAL_TRANSCRIPT_LINES = 200
+
+
+
+
+def session_id():
+    return get_script_run_ctx().session_id
 
+def session_is_active(session_id):
+    return runtime.exists() and runtime.get_instance().is_active_session(session_id)
 
+def media_owner_is_active(owner):
+    # Owners are session IDs, or "job-<id>" for background jobs reading the files
+    if owner.startswith("job-"):
+        job = jobs.get(owner[len("job-"):])
+        return job is not None and not job.finished
+    return session_is_active(owner)
 
+# Files of sessions and jobs that have ended are removed the next time the store needs room
+media_utils.media_store.is_active = media_owner_is_active
+
+def hold_media(*paths):
+    """
+    Leases stored media files for this session; returns False if one of them was evicted.
+    """
+    for path in paths:
+        if path is None:
+            continue
+        if not os.path.exists(path):
+            return False
+        media_utils.media_store.lease(path, session_id())
+    return True
 
 def get_openai_client():
-    return OpenAI(api_key=st.session_state["openai_api_key"])
+    return openai_utils.get_client(st.session_state["openai_api_key"])
 
 def render_youtube_player(video_id, autoplay):
     start = st.session_state.get("seek_to", 0)
@@ -59,65 +92,183 @@ def render_chapter_buttons(chapters):
             args=(seconds,),
         )
 
-def summarize_text(text, context, language):
-    
-    openai_client = get_openai_client()
-    prompt = f""""
-    \n Transciption:{text}
-        Transcription context: {context}
-        Response language: {language}
+def render_transcript_search(transcript, key):
+    """
+    Search box over the transcript; every result is a button that seeks the player to it.
+    """
+    query = st.text_input(t("search_transcript", lang), key=f"{key}_search")
+    if not query:
+        return
+    results = search.search(transcript, query)
+    if not results:
+        st.caption(t("no_search_results", lang))
+        return
+    with st.container(height=300):
+        for result in results:
+            st.button(
+                f"▶ {format_mmss(result['start'])} {result['text']}",
+                key=f"{key}_result_{result['index']}",
+                on_click=set_seek,
+                args=(int(result["start"]),),
+            )
+
+def summary_job(job, transcript, context, language, client, transcribe=None):
+    """
+    Background job: transcribes with transcribe(on_progress, on_segments) when there is no
+    transcript yet, then streams the summary into the job's partial results.
+    While transcribing, the finished beginning of the transcript is published as it grows
+    and long transcripts are already condensed window by window.
+    Returns (transcript, full_summary). Runs off the script thread, so no st.* calls here.
     """
-    stream = openai_client.chat.completions.create(
-        model=MODEL,
-        messages=[
-              {"role": "system", "content": f"""
-               Translate response to {language}.
-               Your task is to create a precise, concise, and accurate summary. 
-               Input is transcription of a video with timestamps. 
-               Output format:
-                1. TL;DR (3–5 points)
-                - The main points/conclusions of the film.
-
-                2. Film Structure (Chapters)
-                - If chapters are provided in the video context, use them. If not, create your own logical division into chapters based on the content.
-                - Use the following chapter header format for each chapter:
-                        #### N. Chapter Title (MM:SS–MM:SS)
-                        - Add bullet points describing this chapter
-                - Chapter numbers N must be sequential (1, 2, 3…)
-                - Timestamps must always be in the format MM:SS (minutes:seconds)
-                - chapter timestamps cannot exceed the video length
-                - Other sections (TL;DR, Key Terms, Conclusions) can have standard Markdown headers (###, ### etc.)
-
-                3. Key Terms and Ideas
-                - A list of terms with a brief explanation
-                - Only terms that actually appear in the material
-
-                4. Author's Conclusions
-                - What is the author's main point or message?
-
-                5. Limitations/Claims
-                - Highlight any uncertainties, simplifications, or things left unsaid in the film.
-
-                Answer Format:
-                - Markdown
-                - Clear headings
-                - Bullet points where possible
-                - No introductions or meta summaries
-               Rules:
-                - Rely solely on the provided material.
-                - Do not add external knowledge.
-                - If something cannot be clearly concluded, state it.
-                - Maintain a neutral, analytical tone. 
-               """},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        stream=True,
+    condenser = summary.IncrementalCondenser(client, on_notes=lambda notes: job.set_partial("notes", notes))
+    try:
+        if transcript is None:
+            job.update(t("transcribing_info", language))
+            segments = []
+
+            def on_segments(new_segments):
+                segments.extend(new_segments)
+                job.set_partial("transcript", Transcript.from_segments(segments))
+                condenser.add(summary.transcript_units(new_segments))
+
+            transcript = transcribe(
+                lambda done, total: job.update(t("transcribing_chunk", language).format(done=done, total=total), done, total),
+                on_segments,
+            )
+        job.set_partial("transcript", transcript)
+        job.update(t("summarizing_info", language), 0, 0)
+        # Published in batches: every partial result makes following pages rerun and re-send it
+        def publish(text, chapters):
+            job.set_partial("chapters", chapters)
+            job.set_partial("summary", text)
+
+        stream = summary.SummaryStream(publish)
+        for token in summary.summarize_text(transcript, context, language, client, condenser=condenser):
+            stream.add(token)
+        full_summary = stream.close()
+    finally:
+        condenser.close()
+    return transcript, full_summary
+
+def transcribe_stored_audio(audio_path, client, audio_hash, on_progress, on_segments, video_path=None, subtitles=None):
+    if subtitles is None and video_path is not None:
+        # A subtitle track in the video saves transcribing what it covers
+        subtitles = audio_utils.extract_subtitles(video_path)
+    return audio_utils.create_transcription(
+        audio_path, client, audio_hash=audio_hash, on_progress=on_progress, on_segments=on_segments,
+        subtitles=subtitles,
     )
-    for chunk in stream:
-        delta = chunk.choices[0].delta
-        if delta.content is not None:
-            yield delta.content
+
+def upload_summary_job(job, *args, **kwargs):
+    # Lets go of the files leased for the job in start_upload_job
+    try:
+        return summary_job(job, *args, **kwargs)
+    finally:
+        media_utils.media_store.release(f"job-{job.id}")
+
+def start_job(session_key, job_key, fn, *args, **kwargs):
+    """
+    Submits a background job, or attaches to the one another session already started for
+    job_key, and remembers it in the session under session_key.
+    """
+    job = jobs.submit(session_key, fn, *args, job_key=job_key, **kwargs)
+    st.session_state[session_key] = job.id
+    st.session_state["metrics_jobs"].append(job.id)
+    return job
+
+def start_upload_job():
+    """
+    Starts the summary job for the stored upload, with the context and subtitles kept in
+    the session. Also the retry callback of a failed upload job.
+    """
+    client = get_openai_client()
+    audio_path = st.session_state["audio_file_path"]
+    video_path = st.session_state["video_file_path"]
+    audio_hash = st.session_state["file_bytes_md5"]
+    subtitles = st.session_state["upload_subtitles"]
+    subtitles_digest = subtitles.digest() if subtitles else None
+    job = start_job(
+        "upload_job_id", ("upload", audio_hash, subtitles_digest, st.session_state["context"], st.session_state["lang"]), upload_summary_job,
+        None, st.session_state["context"], st.session_state["lang"], client,
+        transcribe=lambda on_progress, on_segments: transcribe_stored_audio(
+            audio_path, client, audio_hash, on_progress, on_segments,
+            video_path=video_path, subtitles=subtitles,
+        ),
+    )
+    # Leased before this session can let go of the files, so a job still waiting in the
+    # queue keeps them even if the session uploads another file or ends
+    for path in (audio_path, video_path):
+        if path is not None:
+            media_utils.media_store.lease(path, f"job-{job.id}")
+    return job
+
+def render_job_progress(job):
+    if job.total:
+        st.progress(job.progress, text=job.message)
+    elif job.message:
+        st.info(job.message)
+    if job.requesters > 1:
+        st.caption(t("shared_job", lang).format(count=job.requesters - 1))
+
+def render_job_chapters(job, height):
+    # While the summary streams, its finished chapter headers are already clickable
+    chapters = job.partial("chapters")
+    if chapters:
+        with st.container(height=height):
+            render_chapter_buttons(chapters)
+
+@st.fragment(run_every=jobs.POLL_INTERVAL_S)
+def follow_job(job_id, page_seek_to, *renders):
+    """
+    Panel of a running job: render(job) for each of renders, redrawn every POLL_INTERVAL_S
+    without rerunning the rest of the page, whose media players read their whole file
+    on every run. The page reruns once the job is finished or a chapter button moved
+    the players away from page_seek_to.
+    """
+    job = jobs.get(job_id)
+    if job is None or job.finished or st.session_state.seek_to != page_seek_to:
+        st.rerun()
+    for render in renders:
+        render(job)
+
+def render_job_partial(job):
+    """
+    What a running job has produced so far: the summary once it streams, before that the
+    notes on finished parts and the transcript of the chunks transcribed so far.
+    """
+    partial_summary = job.partial("summary")
+    if partial_summary:
+        st.markdown(partial_summary)
+        return
+    notes = job.partial("notes")
+    if notes:
+        st.markdown(notes)
+    partial_transcript = job.partial("transcript")
+    if isinstance(partial_transcript, Transcript) and partial_transcript:
+        # Only the newest lines: the page reruns every POLL_INTERVAL_S while the job runs
+        st.text("\n".join(partial_transcript.timestamped_lines()[-PARTIAL_TRANSCRIPT_LINES:]))
+
+def render_job_error(job, retry=None):
+    """
+    Shows why a job failed. A transcription that failed part-way can be retried with
+    retry (a button callback): the finished chunks are checkpointed, so only the rest is sent.
+    """
+    if isinstance(job.error, AuthenticationError):
+        st.error(t("invalid_api_key", lang))
+    elif isinstance(job.error, audio_utils.TranscriptionIncomplete):
+        st.warning(t("transcription_incomplete", lang).format(done=job.error.done, total=job.error.total))
+        if retry is not None:
+            st.button(t("retry_transcription", lang), on_click=retry, key=f"retry_{job.id}")
+    else:
+        st.error(f"An error occurred: {str(job.error)}")
+
+def metrics_job():
+    """
+    Starts a metrics job for work done in this session, so its stages can be shown in the sidebar.
+    """
+    job_id = metrics.new_job_id()
+    st.session_state["metrics_jobs"].append(job_id)
+    return metrics.job(job_id)
 
 def request_generation():
     st.session_state["generate_requested"] = True
@@ -125,6 +276,10 @@ def request_generation():
 def request_yt_transcription():
     st.session_state["yt_transcription_requested"] = True
 
+def retry_yt_transcription():
+    request_generation()
+    request_yt_transcription()
+
 # OpenAI API key protection
 if not st.session_state.get("openai_api_key"):
     if "OPENAI_API_KEY" in env:
@@ -146,8 +301,8 @@ if not st.session_state.get("openai_api_key"):
 if "file_bytes_md5" not in st.session_state:
     st.session_state["file_bytes_md5"] = None
 
-if "file_bytes" not in st.session_state:
-    st.session_state["file_bytes"] = None
+if "upload_id" not in st.session_state:
+    st.session_state["upload_id"] = None
 
 if "is_video" not in st.session_state:
     st.session_state["is_video"] = None
@@ -170,6 +325,9 @@ if "chapters" not in st.session_state:
 if "context" not in st.session_state:
     st.session_state["context"] = ""
 
+if "upload_subtitles" not in st.session_state:
+    st.session_state["upload_subtitles"] = None
+
 if "yt_transcript" not in st.session_state:
     st.session_state["yt_transcript"] = None
 
@@ -185,9 +343,21 @@ if "seek_to" not in st.session_state:
 if "generate_requested" not in st.session_state:
     st.session_state["generate_requested"] = False
 
+if "yt_transcription_requested" not in st.session_state:
+    st.session_state["yt_transcription_requested"] = False
+
 if "yt_chapters" not in st.session_state:
     st.session_state["yt_chapters"] = None
 
+if "yt_job_id" not in st.session_state:
+    st.session_state["yt_job_id"] = None
+
+if "upload_job_id" not in st.session_state:
+    st.session_state["upload_job_id"] = None
+
+if "metrics_jobs" not in st.session_state:
+    st.session_state["metrics_jobs"] = []
+
 if "lang" not in st.session_state:
     st.session_state.lang = "english"
 
@@ -201,6 +371,15 @@ with st.sidebar:
     )
     lang = st.session_state["lang"]
     st.info(t("lang_info", lang))
+    queued_requests = openai_utils.queue_depth()
+    if queued_requests:
+        st.caption(t("queued_requests", lang).format(count=queued_requests))
+    if st.checkbox(t("show_metrics", lang)):
+        records = metrics.recent(set(st.session_state["metrics_jobs"]))
+        if records:
+            st.dataframe(records, hide_index=True)
+        else:
+            st.caption(t("no_metrics", lang))
 
 
 left_col, center_col, right_col = st.columns([1, 4, 1])
@@ -221,8 +400,11 @@ with center_col:
 
         if (youtube_id and youtube_id != st.session_state["youtube_id"]): #new url provided
             st.session_state["youtube_id"]=youtube_id
+            st.session_state["yt_transcript"] = None
             st.session_state["yt_full_summary"] = None
+            st.session_state["yt_job_id"] = None
             st.session_state["generate_requested"] = False
+            st.session_state["yt_transcription_requested"] = False
             with yt_video_col:
                 if video_exists:
                     render_youtube_player(youtube_id, False)
@@ -232,31 +414,57 @@ with center_col:
             if st.session_state["generate_requested"]:
                 with yt_video_col:
                     render_youtube_player(youtube_id, True)
-                    if st.session_state["yt_full_summary"] and st.session_state["yt_chapters"]:
+                    yt_job = jobs.get(st.session_state["yt_job_id"])
+                    if yt_job is not None and not yt_job.finished:
+                        follow_job(yt_job.id, st.session_state.seek_to, lambda job: render_job_chapters(job, 340))
+                    elif st.session_state["yt_full_summary"] and st.session_state["yt_chapters"]:
                         with st.container(height=340):
                             render_chapter_buttons(st.session_state["yt_chapters"])
                 with yt_summary_col:
                     with st.container(height=700):
-                        with st.spinner(t("loading", lang)):
-                            placeholder = st.empty()
-                            try:
-                                st.session_state["yt_transcript"] = youtube_utils.fetch_youtube_captions(st.session_state["youtube_id"], language="eng")
-                            except youtube_utils.RequestBlocked:
-                                 st.session_state["yt_transcript"] = None
-                                 st.error(t("transcript_error", lang))
-                                 st.stop()
-                            
+                        job = jobs.get(st.session_state["yt_job_id"])
+                        if job is None:
+                            # Regenerating keeps the transcript (captions or Whisper) this video already has
+                            if st.session_state["yt_transcript"] is None:
+                                try:
+                                    st.session_state["yt_transcript"] = youtube_utils.fetch_youtube_captions(st.session_state["youtube_id"], language="eng")
+                                except youtube_utils.RequestBlocked:
+                                     st.session_state["yt_transcript"] = None
+                                     st.error(t("transcript_error", lang))
+                                     st.stop()
+
                             if st.session_state["yt_transcript"] is None and  not st.session_state["yt_transcription_requested"]:
                                 st.error(t("no_captions", lang))
                                 st.info(t("no_transcription_info", lang))
+                                st.button(t("transcribe_audio", lang), on_click=request_yt_transcription)
                             else:
-                                st.session_state["yt_full_summary"] = ""
-                                for token in summarize_text(st.session_state["yt_transcript"], youtube_utils.fetch_youtube_metadata(url), st.session_state["lang"]):
-                                    st.session_state["yt_full_summary"] += token
-                                    placeholder.markdown(st.session_state["yt_full_summary"])
+                                # Runs in the background, so reruns (chapter clicks, language changes) don't interrupt it
+                                client = get_openai_client()
+                                metadata = youtube_utils.fetch_youtube_metadata(url)
+                                job = start_job(
+                                    "yt_job_id", ("youtube", st.session_state["youtube_id"], st.session_state["lang"]), summary_job,
+                                    st.session_state["yt_transcript"], metadata, st.session_state["lang"], client,
+                                    # No captions - download the audio and transcribe it while it downloads
+                                    transcribe=lambda on_progress, on_segments: audio_utils.create_youtube_transcription(
+                                        url, client, duration=metadata["duration"], on_progress=on_progress, on_segments=on_segments,
+                                    ),
+                                )
+
+                        if job is not None:
+                            if job.state == jobs.FAILED:
+                                render_job_error(job, retry=retry_yt_transcription)
+                                st.session_state["yt_job_id"] = None
+                                st.session_state["generate_requested"] = False
+                                st.session_state["yt_transcription_requested"] = False
+                            elif job.state == jobs.DONE:
+                                st.session_state["yt_transcript"], st.session_state["yt_full_summary"] = job.result
                                 st.session_state["yt_chapters"] = summary.extract_chapters(st.session_state["yt_full_summary"])
+                                st.session_state["yt_job_id"] = None
                                 st.session_state["generate_requested"] = False
+                                st.session_state["yt_transcription_requested"] = False
                                 st.rerun()
+                            else:
+                                follow_job(job.id, st.session_state.seek_to, render_job_progress, render_job_partial)
             else:
                 with yt_video_col:
                         if st.session_state["youtube_id"]:
@@ -267,6 +475,8 @@ with center_col:
                                 chapters = summary.extract_chapters(st.session_state["yt_full_summary"])
                                 with st.container(height=340):
                                     render_chapter_buttons(chapters)
+                            if st.session_state["yt_full_summary"] and st.session_state["yt_transcript"]:
+                                render_transcript_search(st.session_state["yt_transcript"], "yt")
 
                 with yt_summary_col:
                     if st.session_state["yt_full_summary"]:
@@ -284,17 +494,25 @@ with center_col:
         with video_col:
             if uploaded_file:
                 file_extension = uploaded_file.name.split(".")[-1].lower()  # Get file extension
-                file_bytes = uploaded_file.read()
-                file_bytes_md5 = md5(file_bytes).hexdigest()
                 # Recognize if the file is video or audio
                 if file_extension in ["mp3", "wav", "m4a", "ogg"]:
                     st.session_state["is_video"] = False
                 elif file_extension in ["mp4", "mov"]:
                     st.session_state["is_video"] = True
                 # on file change:
-                if st.session_state["file_bytes_md5"] != file_bytes_md5:
+                if st.session_state["upload_id"] != media_utils.upload_id(uploaded_file):
+                    # Store the upload once, shared by identical uploads; only its path and digest
+                    # are kept in the session, which leases the file while it shows it
+                    media_utils.media_store.release(session_id())
+                    try:
+                        file_path, file_bytes_md5 = media_utils.media_store.spool_upload(uploaded_file, suffix=f".{file_extension}")
+                    except media_utils.MediaStoreFull as e:
+                        st.error(str(e))
+                        st.stop()
+                    hold_media(file_path)
+                    st.session_state["upload_id"] = media_utils.upload_id(uploaded_file)
+                    st.session_state["upload_job_id"] = None
                     st.session_state["file_bytes_md5"] = file_bytes_md5
-                    st.session_state["file_bytes"] = file_bytes
                     st.session_state["transcript"] = None
                     st.session_state["edtitable_text"] = None
                     st.session_state["audio_file_path"] = None
@@ -303,29 +521,27 @@ with center_col:
                     
                     # if file is video
                     if st.session_state["is_video"]: 
-                        st.video(st.session_state["file_bytes"], format="video/mp4")
-                        # Save uploaded video to a temporary file
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video_file:
-                            temp_video_file.write(file_bytes)
-                            temp_video_path = temp_video_file.name
-                            st.session_state["video_file_path"] = temp_video_path
+                        st.session_state["video_file_path"] = file_path
+                        st.video(file_path, format="video/mp4")
                         info_audio_placeholder = st.empty()
-                        # Convert video to audio
-                        audio = AudioSegment.from_file(temp_video_path, format="mp4")
-                        # Save audio to a temporary file
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_audio_file:
-                            audio.export(temp_audio_file.name, format="mp3")
-                            st.session_state["audio_file_path"] = temp_audio_file.name  
+                        # Copy the audio track out of the container (or transcode it once)
+                        with metrics_job():
+                            st.session_state["audio_file_path"] = media_utils.media_store.derive(
+                                f"{file_bytes_md5}.audio", lambda out_dir: audio_utils.extract_audio(file_path, out_dir)
+                            )
+                        hold_media(st.session_state["audio_file_path"])
                     
                     else:  # if the file is audio
-                        st.audio(file_bytes, format=f"audio/{file_extension}")
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_audio_file:
-                            temp_audio_file.write(file_bytes)
-                            st.session_state["audio_file_path"] = temp_audio_file.name
+                        st.session_state["audio_file_path"] = file_path
+                        st.audio(file_path, format=f"audio/{file_extension}")
                         st.success(t("audio_upload_success", lang))
 
                 # Uploaded file didn't change
                 else:
+                    if not hold_media(st.session_state["video_file_path"], st.session_state["audio_file_path"]):
+                        # Evicted from the media store - store the upload again
+                        st.session_state["upload_id"] = None
+                        st.rerun()
                     if st.session_state["is_video"]:
                         file_path = st.session_state["video_file_path"]
                     else:
@@ -333,38 +549,40 @@ with center_col:
                     render_local_player(file_path, st.session_state["is_video"])
 
                 info_transcribe_placeholder = st.empty()
-                if st.session_state["transcript"] is None: 
+                upload_job = jobs.get(st.session_state["upload_job_id"])
+                if st.session_state["transcript"] is None and upload_job is None:
                     st.session_state["context"] = st.text_area(t("context", lang), height=100)
-                    if st.button(t("generate", lang), key = "uploaded_file_btn" ):
-                        info_transcribe_placeholder.info(t("transcribing_info", lang))  
-                        try:
-                            st.session_state["transcript"] = audio_utils.create_transcription(open(st.session_state["audio_file_path"], "rb").read(), get_openai_client()) 
-                        except AuthenticationError:
-                            info_transcribe_placeholder.error(t("invalid_api_key", lang))
-                            st.stop()
-                        except Exception as e:
-                            info_transcribe_placeholder.error(f"An error occurred: {str(e)}")
-                            st.stop()
-                        # st.session_state["transcript"] = transcript
-                        st.rerun()
+                    subtitle_file = st.file_uploader(t("send_subtitles", lang), type=["srt", "vtt"], key="subtitle_file")
+                    subtitles = Transcript.from_subtitles(subtitle_file.getvalue()) if subtitle_file else None
+                    if subtitle_file and not subtitles:
+                        st.error(t("subtitles_error", lang))
+                    elif st.button(t("generate", lang), key = "uploaded_file_btn" ):
+                        st.session_state["upload_subtitles"] = subtitles
+                        upload_job = start_upload_job()
+
+                if upload_job is not None:
+                    with info_transcribe_placeholder.container():
+                        if upload_job.state == jobs.FAILED:
+                            render_job_error(upload_job, retry=start_upload_job)
+                            st.session_state["upload_job_id"] = None
+                        elif upload_job.state == jobs.DONE:
+                            st.session_state["transcript"], st.session_state["full_summary"] = upload_job.result
+                            st.session_state["chapters"] = summary.extract_chapters(st.session_state["full_summary"])
+                            st.session_state["upload_job_id"] = None
+                            st.rerun()
+                        else:
+                            follow_job(upload_job.id, st.session_state.seek_to, render_job_progress, lambda job: render_job_chapters(job, 365))
 
                 if st.session_state["full_summary"]:
                     if st.session_state["chapters"]:
                         with st.container(height=365):
                             render_chapter_buttons(st.session_state["chapters"])
+                    render_transcript_search(st.session_state["transcript"], "upload")
         with summary_col:
-            if st.session_state["transcript"]:
-                if not st.session_state["full_summary"]:
-                    info_transcribe_placeholder.info(t("summarizing_info", lang))  
-                    st.session_state["full_summary"] = ""
-                    with st.container(height=700):
-                        placeholder = st.empty()
-                        for token in summarize_text(st.session_state["transcript"], st.session_state["context"], st.session_state["lang"]):
-                            st.session_state["full_summary"] += token
-                            placeholder.markdown(st.session_state["full_summary"])
-                    st.session_state["chapters"] = summary.extract_chapters(st.session_state["full_summary"])
-                    info_transcribe_placeholder.success(t("summary_completed", lang))
-                    st.rerun()
-                else:
-                    with st.container(height=700):
-                        st.markdown(st.session_state["full_summary"])
+            upload_job = jobs.get(st.session_state["upload_job_id"])
+            if upload_job is not None and not upload_job.finished:
+                with st.container(height=700):
+                    follow_job(upload_job.id, st.session_state.seek_to, render_job_partial)
+            elif st.session_state["full_summary"]:
+                with st.container(height=700):
+                    st.markdown(st.session_state["full_summary"])
@@ -1,95 +1,780 @@
 import streamlit as st
-from pydub import AudioSegment
-from pydub.utils import make_chunks
 import json
+import bisect
+import os
+import re
+import subprocess
+import queue
 import tempfile
-from io import BytesIO
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
+import metrics
+import openai_utils
+import youtube_utils
+from cache_utils import DiskCache
+from transcript import Transcript
 
-CHUNK_LENGTH_MINS = 15
+
+MAX_CHUNK_LENGTH_MINS = 60  # upper bound even when the byte budget would allow longer chunks
+FIRST_CHUNK_LENGTH_MINS = 5  # the first chunk is kept short, so the first segments arrive quickly
+FALLBACK_CHUNK_LENGTH_MINS = 10  # used when the bitrate of copied audio is unknown
+MIN_CHUNK_S = 1.0  # shorter remainders go into the previous chunk; the API rejects such short audio
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024  # transcription API upload limit
+UPLOAD_BUDGET_BYTES = int(MAX_UPLOAD_BYTES * 0.9)  # headroom for container overhead and VBR peaks
 AUDIO_TRANSCRIBE_MODEL = "whisper-1"
+MAX_TRANSCRIBE_WORKERS = 4  # upper bound on concurrent Whisper requests per transcription
+TRANSCRIPTION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+CHUNK_CACHE_MAX_BYTES = 256 * 1024 * 1024
+CHUNK_ATTEMPTS = 2  # a chunk whose requests ran out of retries is tried once more...
+CHUNK_RETRY_DELAY_S = 30  # ...after this pause
+
+# Chunk planning
+SILENCE_THRESHOLD_DB = -35  # anything quieter counts as silence
+MIN_SILENCE_S = 0.4  # shortest pause used as a chunk boundary
+DROP_SILENCE_S = 5.0  # pauses at least this long are cut out before upload
+SILENCE_PADDING_S = 0.3  # silence kept on each side of speech when a pause is dropped
+BOUNDARY_SEARCH_S = 60  # how far before the chunk limit to look for a pause
+DOWNLOAD_MARGIN_S = 30  # audio that has to be on disk past a chunk's end before it is cut from a growing download
+DOWNLOAD_POLL_S = 0.5
+SUBTITLE_GAP_S = 30  # spans without subtitles at least this long are transcribed with Whisper
+
+# Subtitle codecs ffmpeg can turn into SRT; bitmap subtitles (PGS, DVD) have no text to read
+TEXT_SUBTITLE_CODECS = {"subrip", "srt", "ass", "ssa", "mov_text", "webvtt", "text"}
+
+# Audio codecs the transcription API accepts as they are, with the container they are copied into
+COPYABLE_AUDIO_CODECS = {"aac": ".m4a", "mp3": ".mp3", "opus": ".ogg", "vorbis": ".ogg", "flac": ".flac"}
+COPYABLE_AUDIO_EXTENSIONS = set(COPYABLE_AUDIO_CODECS.values()) | {".webm"}
+# Encoding applied to every chunk before upload. Speech recognition needs no more than
+# 16 kHz mono; "copy" keeps the source stream where the API accepts it.
+ENCODING_PROFILES = {
+    "opus_16k": {
+        "extension": ".ogg",
+        "bitrate": 24000,
+        "args": ["-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "24k", "-application", "voip"],
+    },
+    "mp3_16k": {
+        "extension": ".mp3",
+        "bitrate": 32000,
+        "args": ["-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", "-b:a", "32k"],
+    },
+    "copy": {"extension": None, "bitrate": None, "args": None},
+}
+ENCODING_PROFILE = "opus_16k"
+# Used when the audio has to be transcoded: 16 kHz mono Opus is plenty for speech
+SPEECH_CODEC_ARGS = ENCODING_PROFILES["opus_16k"]["args"]
+
+transcription_cache = DiskCache("transcriptions", max_bytes=TRANSCRIPTION_CACHE_MAX_BYTES)
+# Per-chunk checkpoints, so a failed or interrupted transcription resumes with the missing chunks
+chunk_cache = DiskCache("transcription_chunks", max_bytes=CHUNK_CACHE_MAX_BYTES)
 
-def split_audio_into_chunks(audio_bytes, chunk_length_ms=CHUNK_LENGTH_MINS * 60 * 1000):
+
+class TranscriptionIncomplete(Exception):
     """
-    Splits the audio into chunks of the specified length.
+    Some chunks could not be transcribed. The others are checkpointed, so transcribing
+    the same source again only sends the missing ones.
     """
-    audio = AudioSegment.from_file(BytesIO(audio_bytes), format="mp3")
-    chunks = make_chunks(audio, chunk_length_ms)
-    return chunks
 
-def transcribe_audio(audio_bytes, client):
-    openai_client = client
-    audio_file = BytesIO(audio_bytes)
-    audio_file.name = "audio.mp3"
-    transcript = openai_client.audio.transcriptions.create(
-        file=audio_file,
-        model=AUDIO_TRANSCRIBE_MODEL,
-        response_format="verbose_json",
+    def __init__(self, done, total, error):
+        super().__init__(
+            f"Transcribed {done} of {total} audio chunks, the rest failed ({error or type(error).__name__}). "
+            "The finished chunks are saved - try again to transcribe only the missing ones."
+        )
+        self.done = done
+        self.total = total
+        self.error = error
+
+def transcription_cache_key(audio_hash):
+    """
+    Cache key for a transcription: the source hash plus every setting that changes the segments.
+    """
+    return f"{audio_hash}:{AUDIO_TRANSCRIBE_MODEL}:{ENCODING_PROFILE}:{MAX_CHUNK_LENGTH_MINS}:{FIRST_CHUNK_LENGTH_MINS}:{SILENCE_THRESHOLD_DB}:{DROP_SILENCE_S}"
+
+def chunk_checkpoint_key(checkpoint, pieces):
+    """
+    Cache key of one chunk: the transcription's key plus the chunk's boundaries in the source.
+    """
+    return f"{checkpoint}:" + ",".join(f"{start:.3f}-{end:.3f}" for start, end in pieces)
+
+def get_audio_duration(audio_path):
+    """
+    Returns the duration of a media file in seconds, read by ffprobe from the container.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", audio_path],
+        capture_output=True, text=True, check=True,
     )
+    return float(result.stdout.strip())
+
+def get_audio_bitrate(audio_path):
+    """
+    Returns the overall bitrate of a media file in bits per second, or None if ffprobe can't tell.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=bit_rate",
+         "-of", "default=noprint_wrappers=1:nokey=1", audio_path],
+        capture_output=True, text=True, check=True,
+    )
+    try:
+        return int(result.stdout.strip())
+    except ValueError:
+        return None
+
+def probe_audio_codec(media_path):
+    """
+    Returns the codec name of the first audio stream (e.g. "aac"), or None if there is none.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name",
+         "-of", "default=noprint_wrappers=1:nokey=1", media_path],
+        capture_output=True, text=True, check=True,
+    )
+    return result.stdout.strip() or None
+
+def probe_subtitle_streams(media_path):
+    """
+    Returns the text subtitle streams of a media file as dicts with "index" (its number
+    among the subtitle streams, for -map 0:s:N), "codec" and "language".
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "s", "-show_entries", "stream=codec_name:stream_tags=language",
+         "-of", "json", media_path],
+        capture_output=True, text=True, check=True,
+    )
+    streams = json.loads(result.stdout or "{}").get("streams", [])
+    return [
+        {"index": i, "codec": stream.get("codec_name"), "language": stream.get("tags", {}).get("language")}
+        for i, stream in enumerate(streams)
+        if stream.get("codec_name") in TEXT_SUBTITLE_CODECS
+    ]
+
+def extract_subtitles(media_path):
+    """
+    Returns the first text subtitle track of a media file as a Transcript,
+    or None if it has none.
+    """
+    with metrics.stage("extract_subtitles", bytes_in=os.path.getsize(media_path)) as record:
+        streams = probe_subtitle_streams(media_path)
+        record["streams"] = len(streams)
+        if not streams:
+            return None
+        result = subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-i", media_path, "-map", f"0:s:{streams[0]['index']}", "-f", "srt", "-"],
+            capture_output=True, check=True,
+        )
+        subtitles = Transcript.from_subtitles(result.stdout)
+        record["segments"] = len(subtitles)
+    return subtitles or None
+
+def extract_audio(media_path, out_dir=None):
+    """
+    Pulls the audio track out of a video file into a temporary file (in out_dir, if given)
+    and returns its path.
+    Codecs the API accepts are copied without decoding; anything else is transcoded
+    once, straight to compact speech-quality Opus.
+    """
+    codec = probe_audio_codec(media_path)
+    if codec is None:
+        raise ValueError("The file has no audio track.")
+    if codec in COPYABLE_AUDIO_CODECS:
+        suffix, codec_args = COPYABLE_AUDIO_CODECS[codec], ["-c:a", "copy"]
+    else:
+        suffix, codec_args = ".ogg", SPEECH_CODEC_ARGS
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=out_dir) as audio_file:
+        audio_path = audio_file.name
+    with metrics.stage("extract_audio", bytes_in=os.path.getsize(media_path), codec=codec) as record:
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", media_path,
+             "-map", "0:a:0", "-vn", "-map_metadata", "-1", *codec_args, audio_path],
+            check=True,
+        )
+        record["bytes_out"] = os.path.getsize(audio_path)
+    return audio_path
+
+def chunk_length_for(profile=ENCODING_PROFILE, source_bitrate=None):
+    """
+    Seconds of audio that fit into UPLOAD_BUDGET_BYTES once encoded with the profile.
+    """
+    bitrate = ENCODING_PROFILES[profile]["bitrate"] or source_bitrate
+    if not bitrate:
+        return FALLBACK_CHUNK_LENGTH_MINS * 60
+    return min(MAX_CHUNK_LENGTH_MINS * 60, UPLOAD_BUDGET_BYTES * 8 / bitrate)
+
+def chunk_codec(audio_path, pieces, profile=ENCODING_PROFILE):
+    """
+    Returns (extension, ffmpeg codec args) for a chunk. With the "copy" profile a single
+    piece of a source the API accepts is stream-copied; everything else is encoded.
+    """
+    encoding = ENCODING_PROFILES[profile]
+    if encoding["args"]:
+        return encoding["extension"], encoding["args"]
+    extension = os.path.splitext(audio_path)[1].lower()
+    if extension in COPYABLE_AUDIO_EXTENSIONS and len(pieces) == 1:
+        return extension, ["-c:a", "copy"]
+    return ".ogg", SPEECH_CODEC_ARGS
+
+def cut_audio_chunk(audio_path, start, duration, out_path, codec_args=SPEECH_CODEC_ARGS):
+    """
+    Cuts [start, start + duration) out of the file with ffmpeg and writes it to out_path.
+    ffmpeg seeks in the input and only touches the requested span, so memory does not
+    depend on the length of the source.
+    """
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-y",
+         "-ss", f"{start:.3f}", "-t", f"{duration:.3f}", "-i", audio_path,
+         "-vn", "-map_metadata", "-1", *codec_args, out_path],
+        check=True,
+    )
+    return out_path
+
+def iter_silences(audio_path):
+    """
+    Yields (start, end) of every pause of at least MIN_SILENCE_S, using ffmpeg's silencedetect,
+    as the scan reaches it. The audio is decoded as a stream, so memory does not depend on
+    the length of the file.
+    """
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-hide_banner", "-i", audio_path, "-vn",
+         "-af", f"silencedetect=noise={SILENCE_THRESHOLD_DB}dB:d={MIN_SILENCE_S}", "-f", "null", "-"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        silence_start = None
+        for line in process.stderr:
+            match = re.search(r"silence_(start|end): (-?[\d.]+)", line)
+            if not match:
+                continue
+            if match.group(1) == "start":
+                silence_start = max(0.0, float(match.group(2)))
+            elif silence_start is not None:
+                yield silence_start, float(match.group(2))
+                silence_start = None
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, "ffmpeg silencedetect")
+        if silence_start is not None:  # file ends in silence
+            yield silence_start, get_audio_duration(audio_path)
+    finally:
+        if process.poll() is None:  # the consumer stopped early
+            process.kill()
+            process.wait()
+
+def plan_audio_chunks(audio_path, chunk_length_s=MAX_CHUNK_LENGTH_MINS * 60, first_chunk_length_s=None):
+    """
+    Plans the chunks sent for transcription. Each chunk is a list of (start, end) pieces of
+    the source, in seconds: pauses longer than DROP_SILENCE_S are left out, and chunk
+    boundaries are moved back to the middle of the nearest pause so words are not cut.
+    No chunk holds more than chunk_length_s of audio (first_chunk_length_s for the first),
+    plus at most MIN_CHUNK_S rather than leaving a remainder too short to transcribe.
+    Chunks are yielded as soon as the silence scan has passed them, so the first ones can
+    be exported and uploaded while the rest of the file is still being scanned.
+    """
+    duration = get_audio_duration(audio_path)
+    cut_points = []
+    current = []
+    current_length = 0.0
+    planned = 0
+
+    def limit_s():
+        return first_chunk_length_s if first_chunk_length_s and not planned else chunk_length_s
+
+    def add(start, end):
+        nonlocal current_length
+        if current and current[-1][1] == start:  # continues the last piece
+            current[-1] = (current[-1][0], end)
+        else:
+            current.append((start, end))
+        current_length += end - start
+
+    def place(start, end):
+        # Fills chunks with the speech span [start, end); every pause inside it is known by now
+        nonlocal current, current_length, planned
+        while end - start > 1e-3:
+            room = limit_s() - current_length
+            if end - start <= room + MIN_CHUNK_S:
+                add(start, end)
+                return
+            if current and room < BOUNDARY_SEARCH_S:
+                # Too little room left to look for a pause - start a new chunk instead
+                yield current
+                current, current_length = [], 0.0
+                planned += 1
+                continue
+            limit = start + room
+            i = bisect.bisect_right(cut_points, limit)
+            cut = cut_points[i - 1] if i and cut_points[i - 1] > max(start, limit - BOUNDARY_SEARCH_S) else limit
+            add(start, cut)
+            yield current
+            current, current_length = [], 0.0
+            planned += 1
+            start = cut
+
+    # Speech spans: everything except the long pauses
+    cursor = 0.0
+    for start, end in iter_silences(audio_path):
+        if end - start < DROP_SILENCE_S:
+            cut_points.append((start + end) / 2)
+            if end > cursor + limit_s() - current_length:
+                # Every pause up to the current chunk's limit is known - cut it now
+                yield from place(cursor, end)
+                cursor = end
+            continue
+        if start + SILENCE_PADDING_S > cursor:
+            yield from place(cursor, start + SILENCE_PADDING_S)
+        cursor = max(cursor, end - SILENCE_PADDING_S)
+    if duration - cursor > SILENCE_PADDING_S:
+        yield from place(cursor, duration)
+    if current:
+        yield current
+
+def export_audio_chunk(audio_path, pieces, out_path, codec_args=SPEECH_CODEC_ARGS):
+    """
+    Writes the given (start, end) pieces of the source, back to back, to out_path.
+    Joining several pieces goes through a filter, so codec_args can't be a stream copy.
+    """
+    if len(pieces) == 1:
+        start, end = pieces[0]
+        return cut_audio_chunk(audio_path, start, end - start, out_path, codec_args)
+    first, last = pieces[0][0], pieces[-1][1]
+    # After the input seek, timestamps in the filter are relative to `first`
+    select = "+".join(f"between(t,{start - first:.3f},{end - first:.3f})" for start, end in pieces)
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-y",
+         "-ss", f"{first:.3f}", "-to", f"{last:.3f}", "-i", audio_path,
+         "-vn", "-map_metadata", "-1", "-af", f"aselect='{select}',asetpts=N/SR/TB",
+         *codec_args, out_path],
+        check=True,
+    )
+    return out_path
+
+def chunk_time_to_source(pieces, seconds):
+    """
+    Maps a time inside an exported chunk back to the time in the source file.
+    """
+    elapsed = 0.0
+    for start, end in pieces:
+        if seconds <= elapsed + (end - start):
+            return start + (seconds - elapsed)
+        elapsed += end - start
+    return pieces[-1][1]
+
+def split_pieces(pieces):
+    """
+    Splits a chunk's pieces into two halves of equal duration.
+    """
+    half = sum(end - start for start, end in pieces) / 2
+    first, second = [], []
+    elapsed = 0.0
+    for start, end in pieces:
+        if elapsed >= half:
+            second.append((start, end))
+        elif elapsed + (end - start) <= half:
+            first.append((start, end))
+        else:
+            cut = start + (half - elapsed)
+            first.append((start, cut))
+            second.append((cut, end))
+        elapsed += end - start
+    return first, second
+
+def export_within_budget(audio_path, pieces, out_dir, name, profile=ENCODING_PROFILE, is_done=None):
+    """
+    Exports a chunk and yields (pieces, chunk_path). If the encoded file is still over
+    MAX_UPLOAD_BYTES (VBR peaks, copied audio) it is split in half and exported again.
+    Chunks for which is_done(pieces) is true (already transcribed) are yielded with
+    chunk_path None instead of being exported.
+    """
+    if is_done is not None and is_done(pieces):
+        yield pieces, None
+        return
+    extension, codec_args = chunk_codec(audio_path, pieces, profile)
+    with metrics.stage("encode_chunk", chunk=name, profile=profile) as record:
+        chunk_path = export_audio_chunk(audio_path, pieces, os.path.join(out_dir, name + extension), codec_args)
+        record["bytes_out"] = os.path.getsize(chunk_path)
+    if os.path.getsize(chunk_path) <= MAX_UPLOAD_BYTES:
+        yield pieces, chunk_path
+        return
+    os.remove(chunk_path)
+    first, second = split_pieces(pieces)
+    yield from export_within_budget(audio_path, first, out_dir, name + "a", profile, is_done)
+    yield from export_within_budget(audio_path, second, out_dir, name + "b", profile, is_done)
+
+def iter_audio_chunks(audio_path, out_dir, profile=ENCODING_PROFILE, is_done=None):
+    """
+    Yields (pieces, chunk_path) for every planned chunk (see plan_audio_chunks), encoded
+    with the profile. The chunk length follows from the upload byte budget at the profile's
+    bitrate. Chunks are cut lazily into out_dir, one ffmpeg call per chunk.
+    """
+    chunk_length_s = chunk_length_for(profile, get_audio_bitrate(audio_path))
+    plan = plan_audio_chunks(audio_path, chunk_length_s, min(chunk_length_s, FIRST_CHUNK_LENGTH_MINS * 60))
+    for i, pieces in enumerate(plan):
+        yield from export_within_budget(audio_path, pieces, out_dir, f"chunk_{i:04d}", profile, is_done)
+
+def iter_span_chunks(audio_path, spans, out_dir, profile=ENCODING_PROFILE, is_done=None):
+    """
+    Yields (pieces, chunk_path) for the (start, end) spans of a file only, each span
+    cut into chunks no longer than the profile allows (see iter_audio_chunks).
+    """
+    chunk_length_s = chunk_length_for(profile, get_audio_bitrate(audio_path))
+    i = 0
+    for start, end in spans:
+        while end - start > 1e-3:
+            chunk_end = start + chunk_length_s
+            if end - chunk_end < MIN_CHUNK_S:  # no remainder too short to transcribe
+                chunk_end = end
+            yield from export_within_budget(audio_path, [(start, chunk_end)], out_dir, f"chunk_{i:04d}", profile, is_done)
+            start = chunk_end
+            i += 1
+
+def iter_downloading_audio_chunks(download, duration, out_dir, profile=ENCODING_PROFILE, is_done=None):
+    """
+    Yields (pieces, chunk_path) for fixed-length chunks of a file that is still being
+    downloaded (youtube_utils.AudioDownload). A chunk is cut as soon as the downloaded
+    share of the file covers it, so early chunks are transcribed while the rest downloads.
+    """
+    if not duration:
+        duration = get_audio_duration(download.wait())
+    while download.total_bytes is None and not download.done.is_set():
+        download.done.wait(DOWNLOAD_POLL_S)
+    source_bitrate = download.total_bytes * 8 / duration if download.total_bytes else None
+    chunk_length_s = chunk_length_for(profile, source_bitrate)
+    start = 0.0
+    i = 0
+    while duration - start > 1e-3:
+        end = start + (chunk_length_s if i else min(chunk_length_s, FIRST_CHUNK_LENGTH_MINS * 60))
+        if duration - end < MIN_CHUNK_S:  # no remainder too short to transcribe
+            end = duration
+        if is_done is not None and is_done([(start, end)]):
+            # Transcribed before - no need to wait for this part of the download
+            yield [(start, end)], None
+            start = end
+            i += 1
+            continue
+        while not download.done.is_set() and (download.path is None or download.fraction() * duration < end + DOWNLOAD_MARGIN_S):
+            download.done.wait(DOWNLOAD_POLL_S)
+        if download.error:
+            raise download.error
+        try:
+            chunks = list(export_within_budget(download.path, [(start, end)], out_dir, f"chunk_{i:04d}", profile, is_done))
+        except subprocess.CalledProcessError:
+            # The partial file could not be read yet (e.g. index not written) - retry on the full file
+            chunks = list(export_within_budget(download.wait(), [(start, end)], out_dir, f"chunk_{i:04d}", profile, is_done))
+        yield from chunks
+        start = end
+        i += 1
+
+def transcribe_audio_file(chunk_path, client):
+    """
+    Transcribes a chunk file from disk and removes it once the response is in.
+    """
+    def request():
+        # Reopened on every attempt, a retried upload has to start from the beginning
+        started = time.perf_counter()
+        with open(chunk_path, "rb") as audio_file:
+            response = client.audio.transcriptions.create(
+                file=audio_file,
+                model=AUDIO_TRANSCRIBE_MODEL,
+                response_format="verbose_json",
+            )
+        record["api_latency_s"] = round(time.perf_counter() - started, 4)
+        return response
+
+    chunk = os.path.splitext(os.path.basename(chunk_path))[0]
+    with metrics.stage("transcribe_chunk", chunk=chunk, bytes_in=os.path.getsize(chunk_path)) as record:
+        transcript = openai_utils.call(client, "audio", request)
+    os.remove(chunk_path)
     return transcript
 
-def format_srt_entry(index, start_time, end_time, text):
+def checkpointed(checkpoint):
+    """
+    is_done callback for the chunk iterators: true for chunks already saved under checkpoint.
+    """
+    if not checkpoint:
+        return None
+    return lambda pieces: chunk_cache.get(chunk_checkpoint_key(checkpoint, pieces)) is not None
+
+def transcribe_chunk(pieces, chunk_path, client, checkpoint=None):
     """
-    Formats a single SRT entry.
+    Returns the segments of one chunk (times relative to the chunk). With a checkpoint key
+    the result is read from / saved to the chunk cache, so finished chunks survive
+    failures elsewhere and process restarts. A chunk whose requests ran out of retries
+    is tried again CHUNK_ATTEMPTS times in total.
     """
-    def format_time(seconds):
-        hours, remainder = divmod(int(seconds), 3600)
-        minutes, seconds = divmod(remainder, 60)
-        milliseconds = int((seconds - int(seconds)) * 1000)
-        return f"{hours:02}:{minutes:02}:{int(seconds):02},{milliseconds:03}"
+    cache_key = chunk_checkpoint_key(checkpoint, pieces) if checkpoint else None
+    segments = chunk_cache.get(cache_key) if cache_key else None
+    if segments is not None:
+        if chunk_path is not None:
+            os.remove(chunk_path)
+        return segments
+    if chunk_path is None:
+        raise ValueError("Chunk checkpoint is missing.")
 
-    start = format_time(start_time)
-    end = format_time(end_time)
-    return f"{index}\n{start} --> {end}\n{text}\n"
+    for attempt in range(CHUNK_ATTEMPTS):
+        try:
+            transcript = transcribe_audio_file(chunk_path, client)
+            break
+        except Exception as e:
+            if not openai_utils.retryable(e) or attempt == CHUNK_ATTEMPTS - 1:
+                raise
+            time.sleep(CHUNK_RETRY_DELAY_S)
+    segments = [
+        {"start": segment.start, "end": segment.end, "text": segment.text.strip()}
+        for segment in transcript.segments
+    ]
+    if cache_key:
+        chunk_cache.set(cache_key, segments)
+    return segments
 
 def parse_transcript(transcript):
-    lines = []
-    for s in transcript["full_transcription"]:
-        if st.session_state["is_timestamped"]:
-            # Convert start and end times to minutes and seconds
-            start_minutes, start_seconds = divmod(int(s['start']), 60)
-            end_minutes, end_seconds = divmod(int(s['end']), 60)
-            # Format the time as MM:SS
-            lines.append(
-                f"[{start_minutes:02d}:{start_seconds:02d} – {end_minutes:02d}:{end_seconds:02d}] {s['text']}"
-            )
+    if st.session_state.get("is_timestamped"):
+        return transcript.to_timestamped_text()
+    return transcript.to_text()
+
+def source_segments(pieces, segments):
+    """
+    Segments of one chunk (see transcribe_chunk) with timestamps in the source.
+    Offsets come from the measured pieces of the source, not from the chunk index.
+    """
+    return [
+        {
+            "start": chunk_time_to_source(pieces, segment["start"]),
+            "end": chunk_time_to_source(pieces, segment["end"]),
+            "text": segment["text"],
+        }
+        for segment in segments
+    ]
+
+def transcribe_segments(chunks, client, max_workers=MAX_TRANSCRIBE_WORKERS, on_progress=None, on_segments=None, checkpoint=None):
+    """
+    Transcribes (pieces, chunk_path) chunks concurrently and returns the segments with
+    absolute timestamps. Each chunk is uploaded as soon as it is cut, so encoding the next
+    chunk overlaps uploading the previous ones. Segments are reassembled in chunk order,
+    whatever order the requests finish in.
+    With a checkpoint key every chunk is saved as soon as it is transcribed (see
+    transcribe_chunk). A chunk that failed with a transient error (see openai_utils.retryable)
+    does not stop the others; once they are finished TranscriptionIncomplete is raised,
+    and a second run only sends the missing chunks. Any other error stops the transcription.
+    Called from the calling thread: on_progress(done, total) after every finished chunk
+    (total counts the chunks cut so far), and on_segments(new_segments) whenever the
+    transcribed beginning of the recording grows, with the segments it grew by.
+    """
+    chunk_pieces = []
+    results = []
+    segments = []
+    events = queue.Queue()
+    stop = threading.Event()
+
+    def produce(executor):
+        # Cuts chunks on its own thread, so finished uploads are reported while the next chunk is cut
+        try:
+            for i, (pieces, chunk_path) in enumerate(chunks):
+                if stop.is_set():
+                    break
+                chunk_pieces.append(pieces)
+                events.put((i, None))
+                future = executor.submit(metrics.bind(transcribe_chunk), pieces, chunk_path, client, checkpoint)
+                future.add_done_callback(lambda future, i=i: events.put((i, future)))
+        except BaseException as e:
+            events.put((None, e))
         else:
-            lines.append(s['text'])
-    return "\n".join(lines)
-
-def create_transcription(audio_bytes, client):
-    """
-    Splits the audio into chunks, transcribes each chunk, and appends timestamps.
-    """
-    chunks = split_audio_into_chunks(audio_bytes)
-    full_transcription = []
-    srt_output = []
-    current_time_offset = 0  # Track the cumulative time offset in seconds
-    progress_bar = st.progress(0, text = "Transcribing audio in progress...")
-    for i, chunk in enumerate(chunks):
-        progress_bar.progress((i + 1) / len(chunks), text = f"Transcribing audio... (chunk {i + 1} of {len(chunks)})")
-        current_time_offset = i * (CHUNK_LENGTH_MINS * 60)
-        transcript = transcribe_audio(chunk.export(format="mp3").read(), client)
-        
-        for segment in transcript.segments:
-            start_time = segment.start + current_time_offset
-            end_time = segment.end + current_time_offset
-            text = segment.text.strip()
-
-            # Append to full transcription
-            full_transcription.append({
-                "start": start_time,
-                "end": end_time,
-                "text": text
-            })
-            srt_output.append(format_srt_entry(len(srt_output) + 1, start_time, end_time, text))
-        # current_time_offset += chunk.duration_seconds
-
-    progress_bar.empty()
-    # Return SRT or plain text based on the session state
-    return {
-        # "srt": 
-        "\n".join(srt_output),  # SRT formatted text
-        #  "full_transcription": 
-    #    full_transcription  # Plain text transcription with timestamps
-    }
\ No newline at end of file
+            events.put((None, None))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        producer = threading.Thread(target=metrics.bind(produce), args=(executor,), daemon=True)
+        producer.start()
+        try:
+            done = 0
+            failed = []
+            cut_all = False
+            while not cut_all or done + len(failed) < len(results):
+                i, item = events.get()
+                if i is None:  # the producer is finished
+                    if item is not None:
+                        raise item
+                    cut_all = True
+                    continue
+                if item is None:  # chunk i was cut and submitted
+                    results.append(None)
+                    continue
+                error = item.exception()
+                if error is not None:
+                    if not checkpoint or not openai_utils.retryable(error):
+                        raise error
+                    failed.append(error)
+                    continue
+                results[i] = item.result()
+                done += 1
+                if on_progress:
+                    on_progress(done, len(results))
+                # Pass on every chunk up to the first one still in flight
+                new_segments = []
+                while len(segments) < len(results) and results[len(segments)] is not None:
+                    segments.append(source_segments(chunk_pieces[len(segments)], results[len(segments)]))
+                    new_segments.extend(segments[-1])
+                if on_segments and new_segments:
+                    on_segments(new_segments)
+        finally:
+            stop.set()
+            # After an error, chunks still waiting for a worker are not sent
+            executor.shutdown(wait=False, cancel_futures=True)
+            producer.join()
+
+    if failed:
+        raise TranscriptionIncomplete(done, len(results), failed[0])
+    return [segment for chunk in segments for segment in chunk]
+
+class SharedTranscription:
+    """
+    A transcription in progress, shared by every caller asking for the same cache key.
+    Progress and segments are passed on to all of them; a caller joining late first
+    gets the progress and the segments reported so far.
+    """
+
+    def __init__(self):
+        self.future = Future()
+        self.progress = None
+        self.segments = []
+        self._listeners = []  # (on_progress, on_segments)
+        self._lock = threading.Lock()
+
+    def join(self, on_progress=None, on_segments=None):
+        with self._lock:
+            if on_progress and self.progress:
+                on_progress(*self.progress)
+            if on_segments and self.segments:
+                on_segments(list(self.segments))
+            self._listeners.append((on_progress, on_segments))
+
+    def report_progress(self, done, total):
+        with self._lock:
+            self.progress = (done, total)
+            for on_progress, _ in self._listeners:
+                if on_progress:
+                    on_progress(done, total)
+
+    def report_segments(self, new_segments):
+        with self._lock:
+            self.segments.extend(new_segments)
+            for _, on_segments in self._listeners:
+                if on_segments:
+                    on_segments(new_segments)
+
+
+_transcriptions = {}  # transcription cache key -> SharedTranscription running for it
+_transcriptions_lock = threading.Lock()
+
+
+def cached_transcription(audio_hash, transcribe, on_progress=None, on_segments=None):
+    """
+    Returns the cached segments for audio_hash, or runs transcribe(on_progress, on_segments)
+    and caches its result. Callers asking for a transcription that is already running
+    wait for it and get its progress and segments, instead of sending the audio again.
+    """
+    cache_key = transcription_cache_key(audio_hash) if audio_hash else None
+    with metrics.stage("transcription") as record:
+        full_transcription = transcription_cache.get(cache_key) if cache_key else None
+        record["cache_hit"] = full_transcription is not None
+        if full_transcription is None and cache_key is None:
+            full_transcription = transcribe(on_progress, on_segments)
+        elif full_transcription is None:
+            with _transcriptions_lock:
+                shared = _transcriptions.get(cache_key)
+                record["shared"] = shared is not None
+                if shared is None:
+                    shared = _transcriptions[cache_key] = SharedTranscription()
+                    owner = True
+                else:
+                    owner = False
+            shared.join(on_progress, on_segments)
+            if owner:
+                try:
+                    full_transcription = transcribe(shared.report_progress, shared.report_segments)
+                    transcription_cache.set(cache_key, full_transcription)
+                    shared.future.set_result(full_transcription)
+                except BaseException as e:
+                    shared.future.set_exception(e)
+                    raise
+                finally:
+                    with _transcriptions_lock:
+                        del _transcriptions[cache_key]
+            else:
+                full_transcription = shared.future.result()
+        record["segments"] = len(full_transcription)
+    return full_transcription
+
+def create_transcription(audio_path, client, audio_hash=None, max_workers=MAX_TRANSCRIBE_WORKERS, on_progress=None, on_segments=None, subtitles=None):
+    """
+    Transcribes the audio file and returns it as a Transcript (see transcribe_segments for
+    the callbacks). When audio_hash is given the segments are looked up in (and saved to) the shared
+    transcription cache, so the same recording is only sent to Whisper once.
+    With subtitles (a Transcript of the recording's own subtitles) only what they leave out
+    is transcribed, see complete_subtitles.
+    """
+    if subtitles:
+        return complete_subtitles(audio_path, subtitles, client, audio_hash, max_workers, on_progress, on_segments)
+
+    checkpoint = transcription_cache_key(audio_hash) if audio_hash else None
+
+    def transcribe(on_progress, on_segments):
+        with tempfile.TemporaryDirectory() as chunk_dir:
+            chunks = iter_audio_chunks(audio_path, chunk_dir, is_done=checkpointed(checkpoint))
+            return transcribe_segments(
+                chunks, client, max_workers=max_workers, on_progress=on_progress, on_segments=on_segments, checkpoint=checkpoint,
+            )
+
+    return Transcript.from_segments(cached_transcription(audio_hash, transcribe, on_progress, on_segments))
+
+def create_youtube_transcription(url, client, duration=None, max_workers=MAX_TRANSCRIBE_WORKERS, on_progress=None, on_segments=None):
+    """
+    Transcribes a YouTube video without captions. The audio is downloaded to disk and
+    chunks are sent to Whisper while the download is still running. Cached by video ID.
+    """
+    audio_hash = f"youtube:{youtube_utils.get_youtube_id(url)}"
+    checkpoint = transcription_cache_key(audio_hash)
+
+    def transcribe(on_progress, on_segments):
+        with tempfile.TemporaryDirectory() as download_dir:
+            download = youtube_utils.AudioDownload(url, download_dir).start()
+            chunks = iter_downloading_audio_chunks(download, duration, download_dir, is_done=checkpointed(checkpoint))
+            return transcribe_segments(
+                chunks, client, max_workers=max_workers, on_progress=on_progress, on_segments=on_segments, checkpoint=checkpoint,
+            )
+
+    return Transcript.from_segments(cached_transcription(audio_hash, transcribe, on_progress, on_segments))
+
+def complete_subtitles(audio_path, subtitles, client, audio_hash=None, max_workers=MAX_TRANSCRIBE_WORKERS, on_progress=None, on_segments=None):
+    """
+    Returns the subtitles with the spans of at least SUBTITLE_GAP_S they don't cover
+    transcribed by Whisper and merged in. Fully subtitled recordings send nothing.
+    on_segments gets the subtitles and the transcribed segments in time order.
+    """
+    spans = subtitles.gaps(get_audio_duration(audio_path), SUBTITLE_GAP_S)
+    if not spans:
+        return subtitles
+    audio_hash = f"{audio_hash}:subtitles:{subtitles.digest()}" if audio_hash else None
+    checkpoint = transcription_cache_key(audio_hash) if audio_hash else None
+
+    def transcribe(on_progress, on_segments):
+        passed = 0  # subtitles already passed to on_segments
+
+        def merge(new_segments):
+            # The subtitles before the newly transcribed segments go first
+            nonlocal passed
+            end = bisect.bisect_left(subtitles.starts, new_segments[0]["start"]) if new_segments else len(subtitles)
+            merged = [subtitles[i] for i in range(passed, max(passed, end))] + list(new_segments)
+            passed = max(passed, end)
+            if merged:
+                on_segments(merged)
+
+        with tempfile.TemporaryDirectory() as chunk_dir:
+            chunks = iter_span_chunks(audio_path, spans, chunk_dir, is_done=checkpointed(checkpoint))
+            transcribed = transcribe_segments(
+                chunks, client, max_workers=max_workers, on_progress=on_progress,
+                on_segments=merge if on_segments else None, checkpoint=checkpoint,
+            )
+        if on_segments:
+            merge([])
+        return sorted(list(subtitles) + transcribed, key=lambda segment: segment["start"])
+
+    return Transcript.from_segments(cached_transcription(audio_hash, transcribe, on_progress, on_segments))
@@ -0,0 +1,142 @@
+"""
+Headless batch processing of YouTube links and local audio/video files.
+
+    python batch.py https://youtu.be/VIDEO_ID lecture.mp4 -o output --jobs 4
+    python batch.py -i links.txt -o output --language polish
+
+Every input gets its own directory in the output directory with transcript.txt,
+transcript.srt, transcript.vtt, summary.md and chapters.json.
+Inputs whose summary.md already exists are skipped, so an interrupted backfill
+can simply be started again.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from hashlib import md5
+
+from dotenv import dotenv_values
+
+import youtube_utils
+import audio_utils
+import summary
+import openai_utils
+import media_utils
+from transcript import Transcript
+
+
+def job_name(source):
+    youtube_id = youtube_utils.get_youtube_id(source)
+    if youtube_id:
+        return youtube_id
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f"{stem}-{md5(os.path.abspath(source).encode()).hexdigest()[:8]}"
+
+
+def process_youtube(url, client, args):
+    youtube_id = youtube_utils.get_youtube_id(url)
+    if not youtube_utils.video_exists_http(youtube_id):
+        raise ValueError("Video not found or private.")
+    metadata = youtube_utils.fetch_youtube_metadata(url)
+    captions = youtube_utils.fetch_youtube_captions(youtube_id)
+    if captions is not None:
+        return captions, Transcript.from_captions(captions), metadata
+
+    # No captions - transcribe the audio track while it downloads
+    transcript = audio_utils.create_youtube_transcription(
+        url, client, duration=metadata["duration"], max_workers=args.transcribe_workers
+    )
+    return transcript, transcript, metadata
+
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".webm")
+
+
+def process_file(path, client, args):
+    is_video = path.lower().endswith(VIDEO_EXTENSIONS)
+    audio_path = audio_utils.extract_audio(path) if is_video else path
+    try:
+        transcript = audio_utils.create_transcription(
+            audio_path, client, audio_hash=media_utils.file_md5(path), max_workers=args.transcribe_workers
+        )
+    finally:
+        if is_video:
+            os.remove(audio_path)
+    return transcript, transcript, args.context
+
+
+def process(source, client, args):
+    started = time.monotonic()
+    out_dir = os.path.join(args.output, job_name(source))
+    if os.path.exists(os.path.join(out_dir, "summary.md")) and not args.overwrite:
+        return out_dir, "skipped", 0.0
+    os.makedirs(out_dir, exist_ok=True)
+
+    if youtube_utils.get_youtube_id(source):
+        transcript, timed_transcript, context = process_youtube(source, client, args)
+    else:
+        transcript, timed_transcript, context = process_file(source, client, args)
+
+    with open(os.path.join(out_dir, "transcript.txt"), "w", encoding="utf-8") as f:
+        f.write(timed_transcript.to_timestamped_text())
+    with open(os.path.join(out_dir, "transcript.srt"), "w", encoding="utf-8") as f:
+        f.write(timed_transcript.to_srt())
+    with open(os.path.join(out_dir, "transcript.vtt"), "w", encoding="utf-8") as f:
+        f.write(timed_transcript.to_vtt())
+
+    full_summary = "".join(summary.summarize_text(transcript, context, args.language, client))
+    with open(os.path.join(out_dir, "summary.md"), "w", encoding="utf-8") as f:
+        f.write(full_summary)
+    with open(os.path.join(out_dir, "chapters.json"), "w", encoding="utf-8") as f:
+        json.dump(summary.extract_chapters(full_summary), f, ensure_ascii=False, indent=2)
+    return out_dir, "done", time.monotonic() - started
+
+
+def read_sources(args):
+    sources = list(args.sources)
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            sources.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    return sources
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe and summarize YouTube videos and local files without the UI.")
+    parser.add_argument("sources", nargs="*", help="YouTube URLs or paths to audio/video files")
+    parser.add_argument("-i", "--input", help="text file with one URL or path per line")
+    parser.add_argument("-o", "--output", default="output", help="output directory (default: output)")
+    parser.add_argument("-j", "--jobs", type=int, default=2, help="inputs processed in parallel (default: 2)")
+    parser.add_argument("--transcribe-workers", type=int, default=audio_utils.MAX_TRANSCRIBE_WORKERS,
+                        help="concurrent Whisper requests per input")
+    parser.add_argument("--language", default="english", help="summary language (default: english)")
+    parser.add_argument("--context", default="", help="additional context for summaries of local files")
+    parser.add_argument("--overwrite", action="store_true", help="process inputs that already have a summary")
+    args = parser.parse_args(argv)
+
+    sources = read_sources(args)
+    if not sources:
+        parser.error("no inputs given")
+
+    api_key = os.environ.get("OPENAI_API_KEY") or dotenv_values(".env").get("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("OPENAI_API_KEY is not set (environment or .env)")
+    client = openai_utils.get_client(api_key)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {executor.submit(process, source, client, args): source for source in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                out_dir, status, elapsed = future.result()
+                print(f"[{status}] {source} -> {out_dir} ({elapsed:.0f}s)", flush=True)
+            except Exception as e:
+                failed += 1
+                print(f"[failed] {source}: {e}", file=sys.stderr, flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""
+Offline benchmark of the transcription, caption and summary stages.
+
+    python benchmark.py --minutes 10 60 240 --output bench.jsonl
+    python benchmark.py --minutes 30 --latency 0.5 --token-latency 0.01 --rate-limit 0.1
+
+Nothing touches the network: synthetic audio is generated with ffmpeg, a local fake
+OpenAI server answers transcription and (streaming) chat requests, and YouTube captions,
+metadata and existence checks are served from canned fixtures. Every stage of every
+input length is reported as one JSON line with wall time, peak RSS, bytes uploaded and
+requests made, so results can be compared across versions.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import resource
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cache_utils
+import metrics
+
+
+SEGMENT_SECONDS = 6.0  # length of a fake transcription segment / caption
+SPEECH_SECONDS = 9  # synthetic audio: tone for this long...
+PAUSE_SECONDS = 3  # ...then silence for this long
+RSS_SAMPLE_INTERVAL_S = 0.05
+
+
+def generate_audio(minutes, out_path):
+    """
+    Writes `minutes` of mono audio alternating tone bursts and pauses, so the silence-aware
+    chunk planner has something to work with.
+    """
+    period = SPEECH_SECONDS + PAUSE_SECONDS
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-y", "-f", "lavfi",
+         "-i", f"sine=frequency=220:sample_rate=16000,volume='lt(mod(t,{period}),{SPEECH_SECONDS})':eval=frame",
+         "-t", str(minutes * 60), "-ac", "1", "-c:a", "libmp3lame", "-b:a", "64k", out_path],
+        check=True,
+    )
+    return out_path
+
+
+def fake_summary(duration):
+    """
+    Markdown in the format the summary prompt asks for, with chapters spanning the duration.
+    """
+    chapters = 6
+    lines = ["### TL;DR", "- First point", "- Second point", "- Third point", "", "### Chapters"]
+    for i in range(chapters):
+        start, end = duration * i / chapters, duration * (i + 1) / chapters
+        lines.append(f"#### {i + 1}. Chapter {i + 1} ({int(start) // 60:02d}:{int(start) % 60:02d}–{int(end) // 60:02d}:{int(end) % 60:02d})")
+        lines.append("- What this chapter is about")
+    lines += ["", "### Key Terms and Ideas", "- Term: explanation", "", "### Author's Conclusions", "- Conclusion"]
+    return "\n".join(lines)
+
+
+def fake_captions(duration):
+    return [
+        {"text": f"caption number {i} with a few words", "start": start, "duration": SEGMENT_SECONDS}
+        for i, start in enumerate(range(0, int(duration), int(SEGMENT_SECONDS)))
+    ]
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for /v1/audio/transcriptions and /v1/chat/completions.
+    Settings and counters live on the server object.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.bytes_received += len(body)
+            server.requests[self.path] = server.requests.get(self.path, 0) + 1
+            rate_limited = random.random() < server.rate_limit
+            if rate_limited:
+                server.rate_limited += 1
+        time.sleep(server.latency)
+        if rate_limited:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"Retry-After": "0.1"})
+        elif self.path.endswith("/audio/transcriptions"):
+            self._transcription(body)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(json.loads(body))
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def _transcription(self, body):
+        message = BytesParser(policy=default_policy).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+        )
+        audio = next(part for part in message.iter_parts() if part.get_filename())
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(audio.get_filename())[1]) as audio_file:
+            audio_file.write(audio.get_content())
+            audio_file.flush()
+            duration = audio_utils.get_audio_duration(audio_file.name)
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(start + SEGMENT_SECONDS, duration)
+            segments.append({
+                "id": len(segments), "seek": 0, "start": start, "end": end,
+                "text": f" segment {len(segments)} of the chunk", "tokens": [], "temperature": 0.0,
+                "avg_logprob": 0.0, "compression_ratio": 1.0, "no_speech_prob": 0.0,
+            })
+            start = end
+        self._send_json(200, {
+            "task": "transcribe", "language": "english", "duration": duration,
+            "text": " ".join(s["text"] for s in segments), "segments": segments,
+        })
+
+    def _chat(self, request):
+        content = fake_summary(self.server.summary_duration)
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": request["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "- 00:00 notes"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for token in content.split(" "):
+            chunk = {
+                "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": request["model"],
+                "choices": [{"index": 0, "delta": {"content": token + " "}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.token_latency)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def start_fake_openai(latency, token_latency, rate_limit):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.latency = latency
+    server.token_latency = token_latency
+    server.rate_limit = rate_limit
+    server.summary_duration = 600
+    server.bytes_received = 0
+    server.requests = {}
+    server.rate_limited = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FakeTranscriptApi:
+    def fetch(self, video_id):
+        duration = FIXTURE_DURATIONS[video_id]
+
+        class Fetched:
+            def to_raw_data(self):
+                return fake_captions(duration)
+
+        return Fetched()
+
+
+class FakeYoutubeDL:
+    def __init__(self, opts):
+        self.opts = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def extract_info(self, url, download=False):
+        video_id = youtube_utils.get_youtube_id(url)
+        return {
+            "title": f"Benchmark video {video_id}", "description": "Canned metadata fixture.",
+            "channel": "benchmark", "upload_date": "20240101",
+            "duration": FIXTURE_DURATIONS[video_id], "tags": ["benchmark"],
+        }
+
+
+class FakeResponse:
+    status_code = 200
+
+
+FIXTURE_DURATIONS = {}
+
+
+def install_youtube_fixtures():
+    youtube_utils.YouTubeTranscriptApi = FakeTranscriptApi
+    youtube_utils.yt_dlp.YoutubeDL = FakeYoutubeDL
+    youtube_utils.requests.get = lambda url, **kwargs: FakeResponse()
+
+
+class RssSampler:
+    """
+    Peak resident set size of this process while the block runs, sampled from /proc
+    (falls back to the lifetime maximum from getrusage where /proc is not available).
+    """
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+        return False
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL_S):
+            self.peak = max(self.peak, self._rss())
+
+    @staticmethod
+    def _rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def code_version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_stage(stage, minutes, server, fn):
+    with server.lock:
+        bytes_before = server.bytes_received
+        requests_before = dict(server.requests)
+        limited_before = server.rate_limited
+    started = time.perf_counter()
+    with RssSampler() as rss, metrics.job() as job_id:
+        result = fn()
+    wall = time.perf_counter() - started
+    # Time spent in each instrumented pipeline stage (summed over chunks and threads)
+    stages = {}
+    for stage_record in metrics.recent({job_id}):
+        stages[stage_record["stage"]] = round(stages.get(stage_record["stage"], 0) + stage_record["duration_s"], 3)
+    with server.lock:
+        requests = {
+            path.rsplit("/v1/", 1)[-1]: count - requests_before.get(path, 0)
+            for path, count in server.requests.items()
+            if count != requests_before.get(path, 0)
+        }
+        record = {
+            "stage": stage,
+            "input_minutes": minutes,
+            "wall_s": round(wall, 3),
+            "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+            "children_max_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+            "bytes_uploaded": server.bytes_received - bytes_before,
+            "requests": requests,
+            "rate_limited": server.rate_limited - limited_before,
+            "stages": stages,
+        }
+    return result, record
+
+
+def benchmark(minutes, server, client, work_dir):
+    duration = minutes * 60
+    server.summary_duration = duration
+    video_id = f"bench{minutes:06d}"
+    FIXTURE_DURATIONS[video_id] = duration
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    records = []
+
+    audio_path, record = run_stage(
+        "generate_audio", minutes, server,
+        lambda: generate_audio(minutes, os.path.join(work_dir, f"bench_{minutes}.mp3")),
+    )
+    records.append(record)
+    transcript, record = run_stage(
+        "transcription", minutes, server,
+        lambda: audio_utils.create_transcription(audio_path, client),
+    )
+    records.append(record)
+    _, record = run_stage(
+        "summary", minutes, server,
+        lambda: "".join(summary.summarize_text(transcript, "", "english", client)),
+    )
+    records.append(record)
+    captions, record = run_stage(
+        "captions", minutes, server,
+        lambda: (
+            youtube_utils.video_exists_http(video_id),
+            youtube_utils.fetch_youtube_metadata(url),
+            youtube_utils.fetch_youtube_captions(video_id),
+        ),
+    )
+    records.append(record)
+    _, record = run_stage(
+        "caption_summary", minutes, server,
+        lambda: "".join(summary.summarize_text(captions[2], captions[1], "english", client)),
+    )
+    records.append(record)
+    os.remove(audio_path)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the transcription and summary pipeline.")
+    parser.add_argument("--minutes", type=int, nargs="+", default=[10, 60, 240], help="input lengths (default: 10 60 240)")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake API latency per request in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="delay between streamed tokens in seconds")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="keep openai_utils.RATE_LIMITS (default: lifted)")
+    parser.add_argument("--output", help="append JSON lines to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="vas-bench-")
+    # Fresh caches, so every run measures cold work
+    cache_utils.CACHE_DIR = os.path.join(work_dir, "cache")
+    metrics.METRICS_DIR = os.path.join(work_dir, "metrics")
+    server = start_fake_openai(args.latency, args.token_latency, args.rate_limit)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    global audio_utils, youtube_utils, summary, openai_utils
+    import audio_utils
+    import youtube_utils
+    import summary
+    import openai_utils
+
+    install_youtube_fixtures()
+    if not args.keep_rate_limits:
+        for limits in openai_utils.RATE_LIMITS.values():
+            limits.update(rpm=None, tpm=None)
+    client = openai_utils.get_client("sk-benchmark")
+
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    version = code_version()
+    try:
+        for minutes in args.minutes:
+            for record in benchmark(minutes, server, client, work_dir):
+                out.write(json.dumps({"version": version, "timestamp": time.time(), **record}) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
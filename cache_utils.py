@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+
+CACHE_DIR = ".cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+FILL_LOCK_STRIPES = 64
+MISSING = object()  # returned by DiskCache.get on a miss when passed as default, so cached None can be told apart
+
+
+class DiskCache:
+    """
+    JSON key/value store in a SQLite file. Every session and worker process that opens
+    the same name shares the entries. Least recently used entries are evicted once the
+    stored values exceed max_bytes. Entries written with a ttl expire after that many seconds.
+    """
+
+    def __init__(self, name, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.path = os.path.join(CACHE_DIR, f"{name}.sqlite3")
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._fill_locks = [threading.Lock() for _ in range(FILL_LOCK_STRIPES)]
+        metrics.register_gauge(f'vas_cache_hits_total{{cache="{name}"}}', lambda: self.hits)
+        metrics.register_gauge(f'vas_cache_misses_total{{cache="{name}"}}', lambda: self.misses)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    expires_at REAL
+                )
+                """
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(entries)")]
+            if "expires_at" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN expires_at REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(hit=row is not None)
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now + ttl if ttl is not None else None),
+            )
+            self._evict(conn)
+
+    def fill_lock(self, key):
+        """
+        Lock to hold while computing a missing entry, so concurrent callers in this process
+        wait for the first one and then find its result instead of fetching it again.
+        """
+        return self._fill_locks[hash(key) % FILL_LOCK_STRIPES]
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def stats(self):
+        """
+        Hit/miss counters of this process since start.
+        """
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -0,0 +1,121 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+MAX_JOB_WORKERS = 4  # jobs running at once in this process; later ones wait in the queue
+JOB_TTL_S = 60 * 60  # finished jobs are kept this long for sessions that come back to them
+POLL_INTERVAL_S = 0.5  # how often the panel of a running job is redrawn
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_jobs = {}
+_by_key = {}  # job_key -> id of the latest job started for it
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=MAX_JOB_WORKERS, thread_name_prefix="job")
+
+
+class Job:
+    """
+    State of a piece of background work: progress, partial results while it runs, and
+    the result or error once it is finished. Written by the worker thread, read by the
+    Streamlit script on every rerun.
+    """
+
+    def __init__(self, kind: str, key=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.requesters = 1  # sessions that asked for this work, see submit()
+        self.state = PENDING
+        self.message = ""
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._partial = {}
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED)
+
+    @property
+    def progress(self) -> float:
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    def update(self, message=None, done=None, total=None):
+        """
+        Progress report from the worker, e.g. job.update("Transcribing", done, total).
+        """
+        with self._lock:
+            if message is not None:
+                self.message = message
+            if done is not None:
+                self.done = done
+            if total is not None:
+                self.total = total
+
+    def set_partial(self, key, value):
+        with self._lock:
+            self._partial[key] = value
+
+    def partial(self, key, default=None):
+        with self._lock:
+            return self._partial.get(key, default)
+
+    def _run(self, fn, args, kwargs):
+        self.state = RUNNING
+        try:
+            with metrics.job(self.id):
+                self.result = fn(self, *args, **kwargs)
+            self.finished_at = time.time()
+            self.state = DONE
+        except Exception as e:
+            self.error = e
+            self.finished_at = time.time()
+            self.state = FAILED
+
+
+def _expire():
+    now = time.time()
+    with _lock:
+        for job_id in [i for i, job in _jobs.items() if job.finished and now - job.finished_at > JOB_TTL_S]:
+            job = _jobs.pop(job_id)
+            if _by_key.get(job.key) == job_id:
+                del _by_key[job.key]
+
+
+def submit(kind: str, fn, *args, job_key=None, **kwargs) -> Job:
+    """
+    Runs fn(job, *args, **kwargs) on the job pool and returns the Job right away.
+    fn must not call Streamlit; it reports through job.update() and job.set_partial().
+    job_key identifies the work (e.g. video ID or content hash plus parameters): while a
+    job with the same key is running or its result is kept, every session that submits
+    it gets that job back instead of starting the same work again. Failed jobs are not reused.
+    """
+    _expire()
+    with _lock:
+        job = _jobs.get(_by_key.get(job_key)) if job_key is not None else None
+        if job is not None and job.state != FAILED:
+            job.requesters += 1
+            return job
+        job = Job(kind, job_key)
+        _jobs[job.id] = job
+        if job_key is not None:
+            _by_key[job_key] = job.id
+    _executor.submit(job._run, fn, args, kwargs)
+    return job
+
+
+def get(job_id) -> Job | None:
+    with _lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,195 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from hashlib import md5
+
+
+SPOOL_BLOCK_SIZE = 1024 * 1024
+MEDIA_DIR = os.path.join(tempfile.gettempdir(), "video_audio_summary")
+MEDIA_QUOTA_BYTES = int(os.environ.get("MEDIA_QUOTA_BYTES", 4 * 1024 ** 3))
+MEDIA_TTL_S = 6 * 60 * 60  # files untouched this long are evicted even if a session still holds them
+TEMP_PREFIX = ".tmp-"  # files still being written; never evicted while younger than MEDIA_TTL_S
+
+
+def upload_id(uploaded_file):
+    """
+    Cheap identity of a Streamlit upload, used to notice a new file without hashing it on every rerun.
+    """
+    return f"{getattr(uploaded_file, 'file_id', '')}:{uploaded_file.name}:{uploaded_file.size}"
+
+
+def spool_upload(uploaded_file, suffix="", dir=None):
+    """
+    Writes an upload to a temporary file block by block and hashes it on the way.
+    Blocks are memoryview slices of the upload buffer, so nothing is copied in memory.
+    Returns (path, md5 hex digest).
+    """
+    digest = md5()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=dir, prefix=TEMP_PREFIX) as spool_file:
+        if hasattr(uploaded_file, "getbuffer"):
+            buffer = uploaded_file.getbuffer()
+            for offset in range(0, len(buffer), SPOOL_BLOCK_SIZE):
+                block = buffer[offset:offset + SPOOL_BLOCK_SIZE]
+                digest.update(block)
+                spool_file.write(block)
+        else:
+            uploaded_file.seek(0)
+            for block in iter(lambda: uploaded_file.read(SPOOL_BLOCK_SIZE), b""):
+                digest.update(block)
+                spool_file.write(block)
+    return spool_file.name, digest.hexdigest()
+
+
+def file_md5(path):
+    digest = md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(SPOOL_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MediaStoreFull(Exception):
+    pass
+
+
+class MediaStore:
+    """
+    Owns the media files of the app (uploads, extracted audio) in one directory.
+    Files are named by content: key (upload md5, plus a variant such as ".audio")
+    and extension, so identical uploads share one file.
+    Owners (sessions, background jobs) lease the files they use. release() drops an
+    owner's leases and deletes the files no other owner holds; owners that have ended
+    (see is_active) are released the next time the store makes room. Above quota_bytes,
+    unleased files are evicted least recently used first, and files untouched for ttl_s
+    are evicted in any case.
+    Leases live in this process: another worker process sharing the directory deletes
+    files when its own owners release them, even if this one still uses them.
+    """
+
+    def __init__(self, root=MEDIA_DIR, quota_bytes=MEDIA_QUOTA_BYTES, ttl_s=MEDIA_TTL_S, is_active=None):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.ttl_s = ttl_s
+        self.is_active = is_active  # is_active(owner) -> False once a session or job has ended
+        self._leases = {}  # owner -> set of paths
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key, suffix):
+        return os.path.join(self.root, f"{key}{suffix}")
+
+    def get(self, key):
+        """
+        Path of the stored file for key (any extension), or None.
+        """
+        for entry in os.scandir(self.root):
+            if os.path.splitext(entry.name)[0] == key and not entry.name.startswith(TEMP_PREFIX):
+                self.touch(entry.path)
+                return entry.path
+        return None
+
+    def touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def put(self, key, src_path):
+        """
+        Moves a finished file (written on the store's file system) into the store under key.
+        If the same content is stored already, the new copy is dropped.
+        """
+        path = self.path(key, os.path.splitext(src_path)[1])
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(src_path)
+                self.touch(path)
+            else:
+                os.replace(src_path, path)
+        return path
+
+    def spool_upload(self, uploaded_file, suffix=""):
+        """
+        Stores a Streamlit upload. Returns (path, md5 hex digest).
+        """
+        self.reserve(getattr(uploaded_file, "size", 0))
+        spool_path, digest = spool_upload(uploaded_file, suffix=suffix, dir=self.root)
+        return self.put(digest, spool_path), digest
+
+    def derive(self, key, build):
+        """
+        Returns the stored file for key, creating it with build(out_dir) -> path on a miss
+        (e.g. the audio track extracted from a stored video).
+        """
+        path = self.get(key)
+        if path is None:
+            self.reserve(0)
+            build_dir = tempfile.mkdtemp(dir=self.root, prefix=TEMP_PREFIX)
+            try:
+                path = self.put(key, build(build_dir))
+            finally:
+                shutil.rmtree(build_dir, ignore_errors=True)
+        return path
+
+    def lease(self, path, owner):
+        with self._lock:
+            self._leases.setdefault(owner, set()).add(path)
+        self.touch(path)
+
+    def release(self, owner):
+        """
+        Drops the owner's leases and deletes the files no one else holds.
+        """
+        with self._lock:
+            paths = self._leases.pop(owner, set())
+            held = set().union(*self._leases.values())
+            for path in paths - held:
+                self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def release_ended(self):
+        if self.is_active is None:
+            return
+        with self._lock:
+            owners = [owner for owner in self._leases if not self.is_active(owner)]
+        for owner in owners:
+            self.release(owner)
+
+    def reserve(self, size):
+        """
+        Makes room for size more bytes: releases ended sessions, evicts expired files and
+        then unleased files, least recently used first. Raises MediaStoreFull if the
+        files in use leave no room.
+        """
+        self.release_ended()
+        now = time.time()
+        with self._lock:
+            held = set().union(*self._leases.values())
+            entries = sorted(
+                (entry for entry in os.scandir(self.root) if entry.is_file()),
+                key=lambda entry: entry.stat().st_mtime,
+            )
+            used = sum(entry.stat().st_size for entry in entries)
+            for entry in entries:
+                expired = now - entry.stat().st_mtime > self.ttl_s
+                if not expired and (used + size <= self.quota_bytes or entry.path in held or entry.name.startswith(TEMP_PREFIX)):
+                    continue
+                used -= entry.stat().st_size
+                self._remove(entry.path)
+            if used + size > self.quota_bytes:
+                raise MediaStoreFull(
+                    f"Media storage is full ({used / 2 ** 20:.0f} of {self.quota_bytes / 2 ** 20:.0f} MiB in use)."
+                )
+
+    def usage(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.root) if entry.is_file())
+
+
+media_store = MediaStore()
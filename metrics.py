@@ -0,0 +1,238 @@
+import atexit
+import contextvars
+import json
+import os
+import resource
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+
+# Where stage records and Prometheus metrics are written; unset, they are only kept in memory
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+METRICS_JSONL = "stages.jsonl"  # one line per finished stage
+METRICS_JSONL_MAX_BYTES = 32 * 1024 * 1024  # above this the JSONL is moved to stages.jsonl.1
+# Prometheus text format for node_exporter's textfile collector, one file per worker process
+METRICS_PROM = f"metrics-{os.getpid()}.prom"
+PROM_WRITE_INTERVAL_S = 5.0
+RSS_SAMPLE_INTERVAL_S = 0.1
+RECENT_RECORDS = 500
+
+_job = contextvars.ContextVar("metrics_job", default=None)
+_lock = threading.Lock()
+_prom_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_RECORDS)
+_totals = {}  # (stage, metric) -> value
+_active = set()  # ids of running stage records, for the RSS sampler
+_records = {}
+_gauges = {}  # "name{labels}" -> callable returning the current value
+_sampler = None
+_prom_path = None  # the file write_prometheus() wrote, removed at exit
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def job(job_id=None):
+    """
+    Tags every stage recorded inside the block (and in threads started through bind) with job_id.
+    """
+    token = _job.set(job_id or new_job_id())
+    try:
+        yield _job.get()
+    finally:
+        _job.reset(token)
+
+
+def bind(fn):
+    """
+    Wraps fn so that it runs with the caller's job, e.g. when submitted to a thread pool.
+    """
+    context = contextvars.copy_context()
+
+    def wrapped(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return wrapped
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _sample_rss():
+    # Also rewrites the Prometheus file every PROM_WRITE_INTERVAL_S, so the last stages
+    # and the gauges reach it even when no further stage finishes
+    last_prom_write = 0.0
+    while True:
+        with _lock:
+            idle = not _active
+        # Between stages there is nothing to sample, only the Prometheus file to refresh
+        time.sleep(PROM_WRITE_INTERVAL_S if idle else RSS_SAMPLE_INTERVAL_S)
+        rss = _rss_bytes()
+        with _lock:
+            for key in _active:
+                record = _records[key]
+                record["peak_rss_mb"] = max(record["peak_rss_mb"], rss / 2 ** 20)
+        if METRICS_DIR and time.monotonic() - last_prom_write >= PROM_WRITE_INTERVAL_S:
+            last_prom_write = time.monotonic()
+            write_prometheus()
+
+
+def _ensure_sampler():
+    global _sampler
+    if _sampler is None:
+        _sampler = threading.Thread(target=_sample_rss, daemon=True)
+        _sampler.start()
+
+
+@contextmanager
+def stage(name, chunk=None, **fields):
+    """
+    Times a pipeline stage. The yielded dict can be filled in by the caller
+    (bytes_in, bytes_out, api_latency_s, ttft_s, tokens, ...); duration, peak RSS and
+    tokens/sec are added when the block ends, and the record is exported.
+    """
+    record = {
+        "ts": time.time(),
+        "job": _job.get(),
+        "stage": name,
+        "chunk": chunk,
+        "peak_rss_mb": _rss_bytes() / 2 ** 20,
+        **fields,
+    }
+    key = id(record)
+    with _lock:
+        _ensure_sampler()
+        _records[key] = record
+        _active.add(key)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration_s"] = round(time.perf_counter() - started, 4)
+        record["peak_rss_mb"] = round(max(record["peak_rss_mb"], _rss_bytes() / 2 ** 20), 1)
+        if record.get("tokens") and record["duration_s"] > record.get("ttft_s", 0):
+            record["tokens_per_s"] = round(record["tokens"] / (record["duration_s"] - record.get("ttft_s", 0)), 1)
+        with _lock:
+            _active.discard(key)
+            del _records[key]
+        _export(record)
+
+
+def _export(record):
+    record = {k: v for k, v in record.items() if v is not None}
+    with _lock:
+        _recent.append(record)
+        name = record["stage"]
+        for metric in ("duration_s", "bytes_in", "bytes_out", "api_latency_s", "ttft_s", "tokens"):
+            if metric in record:
+                _totals[(name, metric)] = _totals.get((name, metric), 0) + record[metric]
+        _totals[(name, "count")] = _totals.get((name, "count"), 0) + 1
+        if "error" in record:
+            _totals[(name, "errors")] = _totals.get((name, "errors"), 0) + 1
+        if not METRICS_DIR:
+            return
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            jsonl_path = os.path.join(METRICS_DIR, METRICS_JSONL)
+            with open(jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                full = f.tell() > METRICS_JSONL_MAX_BYTES
+            if full:
+                os.replace(jsonl_path, jsonl_path + ".1")
+        except OSError:
+            pass  # metrics must never break the pipeline
+
+
+def recent(job_ids=None):
+    """
+    Most recent stage records of this process, optionally only those of the given jobs.
+    """
+    with _lock:
+        records = list(_recent)
+    if job_ids is not None:
+        records = [r for r in records if r.get("job") in job_ids]
+    return records
+
+
+PROM_METRICS = {
+    "count": ("vas_stage_runs_total", "counter", "Finished runs of a pipeline stage"),
+    "errors": ("vas_stage_errors_total", "counter", "Runs of a pipeline stage that raised"),
+    "duration_s": ("vas_stage_duration_seconds_total", "counter", "Time spent in a pipeline stage"),
+    "bytes_in": ("vas_stage_bytes_in_total", "counter", "Bytes read or uploaded by a pipeline stage"),
+    "bytes_out": ("vas_stage_bytes_out_total", "counter", "Bytes written by a pipeline stage"),
+    "api_latency_s": ("vas_api_latency_seconds_total", "counter", "Time waiting for API responses"),
+    "ttft_s": ("vas_time_to_first_token_seconds_total", "counter", "Time to first streamed token"),
+    "tokens": ("vas_tokens_total", "counter", "Streamed completion tokens"),
+}
+
+
+def register_gauge(name, read):
+    """
+    Adds a value to the Prometheus export, e.g. register_gauge('vas_queue_depth', queue_depth).
+    """
+    with _lock:
+        _gauges[name] = read
+
+
+def render_prometheus():
+    """
+    Stage totals and registered gauges in Prometheus text format.
+    """
+    with _lock:
+        totals = dict(_totals)
+        gauges = dict(_gauges)
+    pid = os.getpid()
+    lines = []
+    for metric, (prom_name, prom_type, help_text) in PROM_METRICS.items():
+        samples = [(stage, value) for (stage, m), value in sorted(totals.items()) if m == metric]
+        if not samples:
+            continue
+        lines.append(f"# HELP {prom_name} {help_text}")
+        lines.append(f"# TYPE {prom_name} {prom_type}")
+        lines.extend(f'{prom_name}{{stage="{stage}",pid="{pid}"}} {value}' for stage, value in samples)
+    for name, read in sorted(gauges.items()):
+        labelled = name.replace("}", f',pid="{pid}"}}') if "{" in name else f'{name}{{pid="{pid}"}}'
+        try:
+            lines.append(f"{labelled} {read()}")
+        except Exception:
+            continue
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus():
+    global _prom_path
+    if not METRICS_DIR:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        prom_path = os.path.join(METRICS_DIR, METRICS_PROM)
+        with _prom_lock:
+            with open(prom_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(render_prometheus())
+            os.replace(prom_path + ".tmp", prom_path)  # scrapers never see a half-written file
+            if _prom_path is None:
+                atexit.register(_remove_prometheus)
+            _prom_path = prom_path
+    except OSError:
+        pass
+
+
+def _remove_prometheus():
+    # A dead process's series must not linger in the textfile collector
+    try:
+        os.remove(_prom_path)
+    except OSError:
+        pass
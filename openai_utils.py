@@ -0,0 +1,182 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from openai import OpenAI, RateLimitError, APIStatusError, APIConnectionError
+
+import metrics
+
+
+def _env_limit(kind, name, default):
+    value = os.environ.get(f"OPENAI_{kind.upper()}_{name.upper()}")
+    return int(value) if value else default
+
+
+# Per API key and endpoint kind; None means "not limited". The defaults are the lowest
+# paid tier's. Environment variables such as OPENAI_CHAT_TPM override them; otherwise the
+# limits the API reports in its x-ratelimit-limit-* headers replace them as soon as seen.
+RATE_LIMITS = {
+    "chat": {"rpm": _env_limit("chat", "rpm", 500), "tpm": _env_limit("chat", "tpm", 30000)},
+    "audio": {"rpm": _env_limit("audio", "rpm", 50), "tpm": _env_limit("audio", "tpm", None)},
+}
+RATE_LIMIT_HEADERS = {"rpm": "x-ratelimit-limit-requests", "tpm": "x-ratelimit-limit-tokens"}
+MAX_RETRIES = 6
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+WINDOW_S = 60.0
+
+_clients = {}
+_limiters = {}
+_lock = threading.Lock()
+
+
+def get_client(api_key):
+    """
+    Returns the shared OpenAI client (and its HTTP connection pool) for the API key.
+    Retries are handled by call(), so the client's own retries are disabled.
+    """
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = OpenAI(api_key=api_key, max_retries=0)
+        return client
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window of requests and tokens. acquire() blocks until the
+    request fits into both limits; pause() holds every caller back after a 429.
+    """
+
+    def __init__(self, rpm=None, tpm=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.waiting = 0
+        self._requests = deque()  # (time, tokens)
+        self._tokens_used = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _expire(self, now):
+        while self._requests and self._requests[0][0] <= now - WINDOW_S:
+            self._tokens_used -= self._requests.popleft()[1]
+
+    def _fits(self, tokens):
+        if not self._requests:
+            return True
+        if self.rpm and len(self._requests) >= self.rpm:
+            return False
+        return not self.tpm or self._tokens_used + tokens <= self.tpm
+
+    def acquire(self, tokens=0):
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._expire(now)
+                    wait = self._paused_until - now
+                    if wait <= 0:
+                        if self._fits(tokens):
+                            self._requests.append((now, tokens))
+                            self._tokens_used += tokens
+                            return
+                        wait = self._requests[0][0] + WINDOW_S - now
+                    self._cond.wait(timeout=max(wait, 0.05))
+            finally:
+                self.waiting -= 1
+
+    def update(self, rpm, tpm):
+        with self._cond:
+            self.rpm = rpm
+            self.tpm = tpm
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+def get_limiter(api_key, kind):
+    with _lock:
+        limiter = _limiters.get((api_key, kind))
+        if limiter is None:
+            limiter = _limiters[(api_key, kind)] = RateLimiter(**RATE_LIMITS[kind])
+        return limiter
+
+
+def queue_depth():
+    """
+    Number of requests currently waiting for a rate limit slot, over all keys.
+    """
+    with _lock:
+        limiters = list(_limiters.values())
+    return sum(limiter.waiting for limiter in limiters)
+
+
+metrics.register_gauge("vas_openai_queue_depth", queue_depth)
+
+
+def retryable(error) -> bool:
+    """
+    True for errors worth trying again: 429s, 5xx responses, dropped connections and timeouts.
+    """
+    if isinstance(error, RateLimitError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def _retry_delay(error, attempt):
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(retry_after), BACKOFF_MAX_S)
+    except (TypeError, ValueError):
+        # Exponential backoff with jitter, so queued requests don't retry in lockstep
+        return random.uniform(0.5, 1.0) * min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)
+
+
+def _adopt_limits(limiter, kind, response):
+    # Only limits not pinned by an environment variable follow the API's headers
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return
+    limits = {"rpm": limiter.rpm, "tpm": limiter.tpm}
+    for name, header in RATE_LIMIT_HEADERS.items():
+        if f"OPENAI_{kind.upper()}_{name.upper()}" in os.environ or limits[name] is None:
+            continue
+        try:
+            limits[name] = int(headers[header])
+        except (KeyError, ValueError):
+            pass
+    if (limits["rpm"], limits["tpm"]) != (limiter.rpm, limiter.tpm):
+        limiter.update(**limits)
+
+
+def call(client, kind, request, tokens=0):
+    """
+    Runs request() once the rate limiter for (client API key, kind) has room for it,
+    retrying 429s, 5xx responses and dropped connections with backoff.
+    request must be safe to call again (e.g. reopen files inside it).
+    """
+    limiter = get_limiter(client.api_key, kind)
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(tokens)
+        try:
+            result = request()
+            # Streams keep their HTTP response; parsed results and errors without one don't
+            _adopt_limits(limiter, kind, getattr(result, "response", None))
+            return result
+        except (RateLimitError, APIStatusError, APIConnectionError) as e:
+            _adopt_limits(limiter, kind, getattr(e, "response", None))
+            if not retryable(e) or attempt == MAX_RETRIES:
+                raise
+            delay = _retry_delay(e, attempt)
+            if isinstance(e, RateLimitError):
+                limiter.pause(delay)
+            time.sleep(delay)
@@ -0,0 +1,130 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+from array import array
+from collections import OrderedDict, defaultdict
+
+from transcript import Transcript
+
+
+TOKEN_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+MAX_RESULTS = 50
+INDEX_CACHE_SIZE = 16  # transcripts whose index is kept in memory, shared by all sessions
+
+_indexes = OrderedDict()  # transcript digest -> TranscriptIndex
+_lock = threading.Lock()
+
+
+def tokenize(text: str) -> list[str]:
+    return [token.casefold() for token in TOKEN_RE.findall(text)]
+
+
+def parse_query(query: str) -> list[list[str]]:
+    """
+    Splits a query into terms: a "quoted phrase" is one term of several words,
+    every other word is a term of its own.
+    """
+    terms = []
+    for phrase, word in QUERY_RE.findall(query):
+        if phrase:
+            words = tokenize(phrase)
+            if words:
+                terms.append(words)
+        else:
+            terms.extend([token] for token in tokenize(word))
+    return terms
+
+
+def _contains(positions, position) -> bool:
+    i = bisect.bisect_left(positions, position)
+    return i < len(positions) and positions[i] == position
+
+
+class TranscriptIndex:
+    """
+    Positional inverted index over the words of a transcript. The whole transcript is
+    one stream of words, so phrases are found even when captions split them across
+    segments; every word position maps back to the segment it came from.
+    """
+
+    def __init__(self, transcript: Transcript):
+        self.transcript = transcript
+        self.segment_of = array("I")  # word position -> segment index
+        postings = defaultdict(list)
+        position = 0
+        for i in range(len(transcript)):
+            for token in tokenize(transcript.text(i)):
+                postings[token].append(position)
+                position += 1
+            self.segment_of.extend([i] * (position - len(self.segment_of)))
+        self.postings = {token: array("I", positions) for token, positions in postings.items()}
+        self.word_count = position
+
+    def phrase_positions(self, words: list[str]) -> list[int]:
+        """
+        Word positions where the words occur one after another.
+        """
+        lists = [self.postings.get(word) for word in words]
+        if not all(lists):
+            return []
+        # Walk the rarest word and look the others up around it
+        rarest = min(range(len(words)), key=lambda j: len(lists[j]))
+        matches = []
+        for position in lists[rarest]:
+            start = position - rarest
+            if all(_contains(lists[j], start + j) for j in range(len(words)) if j != rarest):
+                matches.append(start)
+        return matches
+
+    def search(self, query: str, limit: int = MAX_RESULTS) -> list[dict]:
+        """
+        Segments matching the query, best first, as dicts with "index", "start", "end",
+        "text" and "score". Segments matching more (and rarer) terms score higher;
+        a phrase counts once per word.
+        """
+        scores = defaultdict(float)
+        for words in parse_query(query):
+            positions = self.phrase_positions(words)
+            if not positions:
+                continue
+            weight = len(words) * math.log(1 + self.word_count / len(positions))
+            for position in positions:
+                scores[self.segment_of[position]] += weight
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [
+            {
+                "index": i,
+                "start": self.transcript.starts[i],
+                "end": self.transcript.ends[i],
+                "text": self.transcript.text(i),
+                "score": round(score, 3),
+            }
+            for i, score in ranked
+        ]
+
+
+def get_index(transcript) -> TranscriptIndex:
+    """
+    Returns the index of a Transcript (or raw YouTube captions), building it on first use.
+    """
+    if not isinstance(transcript, Transcript):
+        transcript = Transcript.from_captions(transcript)
+    key = transcript.digest()
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = TranscriptIndex(transcript)
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def search(transcript, query: str, limit: int = MAX_RESULTS) -> list[dict]:
+    return get_index(transcript).search(query, limit)
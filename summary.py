@@ -1,26 +1,494 @@
 import re
+import json
+import threading
+import time
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+
+import metrics
+import openai_utils
+from cache_utils import DiskCache
+from transcript import Transcript
+
+MODEL = "gpt-4o"
+SUMMARY_TOKEN_BUDGET = 24000  # transcripts above this go through map-reduce
+SUMMARY_WINDOW_TOKENS = 6000  # size of one map window
+WINDOW_NOTES_MAX_TOKENS = 900  # cap on the notes produced for one window
+MAX_SUMMARY_WORKERS = 4
+SUMMARY_OUTPUT_TOKENS = 2000  # expected length of a summary, reserved in the rate limiter
+PROMPT_VERSION = 2  # bump when the prompts change, so cached summaries are not reused
+SUMMARY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+STREAM_FLUSH_S = 0.3  # a streaming summary is published at most this often...
+STREAM_FLUSH_CHARS = 1000  # ...unless this much new text is waiting
+
+summary_cache = DiskCache("summaries", max_bytes=SUMMARY_CACHE_MAX_BYTES)
+
+SUMMARY_SYSTEM_PROMPT = """
+               Translate response to {language}.
+               Your task is to create a precise, concise, and accurate summary. 
+               Input is transcription of a video with timestamps. 
+               Output format:
+                1. TL;DR (3–5 points)
+                - The main points/conclusions of the film.
+
+                2. Film Structure (Chapters)
+                - If chapters are provided in the video context, use them. If not, create your own logical division into chapters based on the content.
+                - Use the following chapter header format for each chapter:
+                        #### N. Chapter Title (MM:SS–MM:SS)
+                        - Add bullet points describing this chapter
+                - Chapter numbers N must be sequential (1, 2, 3…)
+                - Timestamps must always be in the format MM:SS (minutes:seconds)
+                - chapter timestamps cannot exceed the video length
+                - Other sections (TL;DR, Key Terms, Conclusions) can have standard Markdown headers (###, ### etc.)
+
+                3. Key Terms and Ideas
+                - A list of terms with a brief explanation
+                - Only terms that actually appear in the material
+
+                4. Author's Conclusions
+                - What is the author's main point or message?
+
+                5. Limitations/Claims
+                - Highlight any uncertainties, simplifications, or things left unsaid in the film.
+
+                Answer Format:
+                - Markdown
+                - Clear headings
+                - Bullet points where possible
+                - No introductions or meta summaries
+               Rules:
+                - Rely solely on the provided material.
+                - Do not add external knowledge.
+                - If something cannot be clearly concluded, state it.
+                - Maintain a neutral, analytical tone. 
+               """
+
+WINDOW_SYSTEM_PROMPT = """
+               You are condensing one part of a longer video transcription with timestamps.
+               Write concise bullet-point notes covering everything said in this part, in the language of the transcription.
+               Start every bullet with the MM:SS timestamp where the point is made, e.g. "- 12:34 ...".
+               Keep names, numbers, definitions and claims. No introductions or meta comments.
+               """
+
+TRANSLATE_SYSTEM_PROMPT = """
+               Translate the Markdown summary given by the user to {language}.
+               Rules:
+                - Keep the Markdown structure, headings, bullet points and their order exactly as they are.
+                - Chapter headers have the form "#### N. Chapter Title (MM:SS–MM:SS)": translate only the title,
+                  keep "####", the number N and the timestamps in parentheses unchanged.
+                - Do not add, drop or merge anything. Output only the translation.
+               """
 
 CHAPTER_RE = re.compile(
     r"####\s+\d+\.\s+(?P<title>.+?)\s+\((?P<start>\d+:\d+)[–-](?P<end>\d+:\d+)\)"
 )
 
 
+def _chapter(match) -> dict:
+    return {
+        "title": match.group("title"),
+        "start": match.group("start"),
+        "end": match.group("end"),
+    }
+
+
 def extract_chapters(markdown: str) -> list[dict]:
-    chapters = []
+    return [_chapter(match) for match in CHAPTER_RE.finditer(markdown)]
+
+
+class SummaryStream:
+    """
+    Collects a streamed summary and publishes it in batches instead of per token:
+    on_flush(text, chapters) runs at most every STREAM_FLUSH_S, sooner when
+    STREAM_FLUSH_CHARS of new text are waiting or a chapter header was completed.
+    Chapter headers are parsed once, when their line ends, so the chapters are known
+    while the rest of the summary is still streaming.
+    """
+
+    def __init__(self, on_flush, flush_s=STREAM_FLUSH_S, flush_chars=STREAM_FLUSH_CHARS):
+        self.on_flush = on_flush
+        self.flush_s = flush_s
+        self.flush_chars = flush_chars
+        self.text = ""
+        self.chapters = []
+        self._parts = []  # tokens since the last flush
+        self._pending = 0
+        self._line = ""  # the unfinished last line
+        self._flushed_at = 0.0  # the first token is published right away
 
-    for match in CHAPTER_RE.finditer(markdown):
-        chapters.append({
-            "title": match.group("title"),
-            "start": match.group("start"),
-            "end": match.group("end"),
-        })
+    def _parse_line(self, line) -> bool:
+        match = CHAPTER_RE.search(line) if line.lstrip().startswith("####") else None
+        if match:
+            self.chapters.append(_chapter(match))
+        return match is not None
 
-    return chapters
+    def add(self, token: str):
+        self._parts.append(token)
+        self._pending += len(token)
+        new_chapter = False
+        if "\n" in token:
+            *lines, self._line = (self._line + token).split("\n")
+            for line in lines:
+                new_chapter = self._parse_line(line) or new_chapter
+        else:
+            self._line += token
+        if new_chapter or self._pending >= self.flush_chars or time.monotonic() - self._flushed_at >= self.flush_s:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.text += "".join(self._parts)
+            self._parts.clear()
+            self._pending = 0
+        self._flushed_at = time.monotonic()
+        self.on_flush(self.text, list(self.chapters))
+
+    def close(self) -> str:
+        """
+        Publishes what is left and returns the whole summary.
+        """
+        self._parse_line(self._line)
+        self._line = ""
+        self.flush()
+        return self.text
 
 def timestamp_to_seconds(ts: str) -> int:
     m, s = map(int, ts.split(":"))
     return m * 60 + s
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token), good enough for budgeting prompts.
+    """
+    return len(text) // 4 + 1
+
+
+def as_transcript(transcript) -> Transcript | None:
+    """
+    A Transcript for Transcript objects and raw caption dicts, None for anything else.
+    """
+    if isinstance(transcript, Transcript):
+        return transcript
+    if isinstance(transcript, (list, tuple)) and transcript and isinstance(transcript[0], dict):
+        if "duration" in transcript[0]:
+            return Transcript.from_captions(transcript)
+        return Transcript.from_segments(transcript)
+    return None
+
+
+def transcript_units(transcript) -> list[str]:
+    """
+    Splits a transcript into the smallest pieces that may not be cut when windowing:
+    one compact "[MM:SS] text" line per sentence or window of a Transcript or captions
+    (see Transcript.compact), one block per SRT entry or line of text.
+    """
+    timed = as_transcript(transcript)
+    if timed is not None:
+        return timed.compact().compact_lines()
+    if isinstance(transcript, (set, list, tuple)):
+        transcript = "\n\n".join(str(item) for item in transcript)
+    text = str(transcript)
+    units = re.split(r"\n\s*\n", text) if "\n\n" in text else text.splitlines()
+    return [unit.strip() for unit in units if unit.strip()]
+
+
+def split_into_windows(units: list[str], max_tokens: int = SUMMARY_WINDOW_TOKENS) -> list[str]:
+    windows = []
+    current = []
+    current_tokens = 0
+    for unit in units:
+        unit_tokens = estimate_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            windows.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        windows.append("\n".join(current))
+    return windows
+
+
+def summarize_window(window: str, client) -> str:
+    with metrics.stage("summary_window", bytes_in=len(window.encode("utf-8"))) as record:
+        started = time.perf_counter()
+        response = _summarize_window(window, client)
+        record["api_latency_s"] = round(time.perf_counter() - started, 4)
+    return response.choices[0].message.content.strip()
+
+
+def _summarize_window(window: str, client):
+    return openai_utils.call(
+        client,
+        "chat",
+        lambda: client.chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": WINDOW_SYSTEM_PROMPT},
+                {"role": "user", "content": window},
+            ],
+            temperature=0.3,
+            max_tokens=WINDOW_NOTES_MAX_TOKENS,
+        ),
+        tokens=estimate_tokens(window) + WINDOW_NOTES_MAX_TOKENS,
+    )
+
+
+def condense_transcript(units: list[str], client) -> str:
+    """
+    Map step: summarizes token-bounded windows concurrently and joins the notes in order.
+    Repeats on the notes themselves until they fit into SUMMARY_TOKEN_BUDGET.
+    """
+    while True:
+        windows = split_into_windows(units)
+        with ThreadPoolExecutor(max_workers=MAX_SUMMARY_WORKERS) as executor:
+            notes = "\n".join(executor.map(metrics.bind(lambda window: summarize_window(window, client)), windows))
+        if estimate_tokens(notes) <= SUMMARY_TOKEN_BUDGET or len(windows) == 1:
+            return notes
+        units = notes.splitlines()
+
+
+class IncrementalCondenser:
+    """
+    Map step for a transcript that is still arriving. Units are fed in with add(); once
+    more than SUMMARY_TOKEN_BUDGET has come in (so the transcript will need map-reduce
+    anyway) every completed window is summarized right away, while the rest is still
+    being transcribed. notes() waits for the windows and returns what condense_transcript
+    would have returned, or None if the transcript turned out to fit the budget.
+    """
+
+    def __init__(self, client, on_notes=None):
+        self.client = client
+        self.on_notes = on_notes  # called with the notes of the leading finished windows
+        self._executor = ThreadPoolExecutor(max_workers=MAX_SUMMARY_WORKERS)
+        self._futures = []
+        self._closed = []  # complete windows not submitted yet
+        self._window = []
+        self._window_tokens = 0
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._tokens > SUMMARY_TOKEN_BUDGET
+
+    def add(self, units: list[str]):
+        for unit in units:
+            unit_tokens = estimate_tokens(unit)
+            if self._window and self._window_tokens + unit_tokens > SUMMARY_WINDOW_TOKENS:
+                self._closed.append("\n".join(self._window))
+                self._window, self._window_tokens = [], 0
+            self._window.append(unit)
+            self._window_tokens += unit_tokens
+            self._tokens += unit_tokens
+        if self.started:
+            self._submit_closed()
+
+    def _submit_closed(self):
+        for window in self._closed:
+            future = self._executor.submit(metrics.bind(summarize_window), window, self.client)
+            future.add_done_callback(self._notify)
+            with self._lock:
+                self._futures.append(future)
+        self._closed = []
+
+    def _notify(self, future):
+        if self.on_notes is not None and not future.exception():
+            self.on_notes(self.ready_notes())
+
+    def ready_notes(self) -> str:
+        """
+        Notes of the leading windows that are already summarized.
+        """
+        notes = []
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            if not future.done() or future.exception():
+                break
+            notes.append(future.result())
+        return "\n".join(notes)
+
+    def notes(self) -> str | None:
+        try:
+            if self._window:
+                self._closed.append("\n".join(self._window))
+                self._window, self._window_tokens = [], 0
+            if not self.started:
+                return None
+            self._submit_closed()
+            notes = "\n".join(future.result() for future in self._futures)
+        finally:
+            self.close()
+        if estimate_tokens(notes) > SUMMARY_TOKEN_BUDGET:
+            notes = condense_transcript(notes.splitlines(), self.client)
+        return notes
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_summary(text, context, language, client):
+    prompt = f""""
+    \n Transciption:{text}
+        Transcription context: {context}
+        Response language: {language}
+    """
+    system_prompt = SUMMARY_SYSTEM_PROMPT.format(language=language)
+    # Only opening the stream is retried; it is where 429s surface
+    open_stream = lambda: openai_utils.call(
+        client,
+        "chat",
+        lambda: client.chat.completions.create(
+            model=MODEL,
+            messages=[
+                  {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            stream=True,
+        ),
+        tokens=estimate_tokens(system_prompt + prompt) + SUMMARY_OUTPUT_TOKENS,
+    )
+    yield from stream_content(open_stream, "summary_stream")
+
+
+def stream_content(open_stream, stage_name):
+    """
+    Yields the text deltas of a streamed chat completion, recording time to first token
+    and the number of streamed chunks (roughly one token each) as a metrics stage.
+    """
+    with metrics.stage(stage_name, tokens=0) as record:
+        started = time.perf_counter()
+        for chunk in open_stream():
+            delta = chunk.choices[0].delta
+            if delta.content is not None:
+                if "ttft_s" not in record:
+                    record["ttft_s"] = round(time.perf_counter() - started, 4)
+                record["tokens"] += 1
+                yield delta.content
+
+
+def transcript_digest(transcript) -> str:
+    if isinstance(transcript, Transcript):
+        return transcript.digest()
+    return md5(json.dumps(transcript, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def summary_source_key(transcript_hash, context) -> str:
+    """
+    Identifies "this transcript with this context, model and prompt version", in any language.
+    """
+    payload = json.dumps([transcript_hash, context, MODEL, PROMPT_VERSION], ensure_ascii=False, sort_keys=True, default=str)
+    return md5(payload.encode("utf-8")).hexdigest()
+
+
+def restore_chapter_timestamps(translated: str, original: str) -> str | None:
+    """
+    Puts the original chapter timestamps back into a translated summary, in order.
+    Returns None if the translation lost or added chapter headers.
+    """
+    original_chapters = extract_chapters(original)
+    if len(extract_chapters(translated)) != len(original_chapters):
+        return None
+    chapters = iter(original_chapters)
+
+    def restore(match):
+        chapter = next(chapters)
+        return match.group(0).replace(
+            f"({match.group('start')}", f"({chapter['start']}", 1
+        ).replace(f"{match.group('end')})", f"{chapter['end']})", 1)
+
+    return CHAPTER_RE.sub(restore, translated)
+
+
+def translate_summary(full_summary, language, client):
+    """
+    Streams the translation of an existing summary - a far smaller request than summarizing again.
+    """
+    system_prompt = TRANSLATE_SYSTEM_PROMPT.format(language=language)
+    open_stream = lambda: openai_utils.call(
+        client,
+        "chat",
+        lambda: client.chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": full_summary},
+            ],
+            temperature=0.2,
+            stream=True,
+        ),
+        tokens=estimate_tokens(system_prompt + full_summary) * 2,
+    )
+    yield from stream_content(open_stream, "summary_translate")
+
+
+def prompt_transcript(text) -> str:
+    """
+    The transcript as it is put into prompts: compact "[MM:SS] text" lines instead of
+    caption dicts or per-segment ranges. Token counts before and after are recorded
+    as the compact_transcript metrics stage.
+    """
+    with metrics.stage("compact_transcript") as record:
+        units = transcript_units(text)
+        compact = "\n".join(units)
+        record["tokens_before"] = estimate_tokens(str(text))
+        record["tokens_after"] = estimate_tokens(compact)
+    return compact
+
+
+def generate_summary(text, context, language, client, condenser=None):
+    """
+    Streams the TL;DR/chapters summary of a transcript.
+    Long transcripts are first condensed window by window (map) and the final summary is
+    generated from the timestamped notes (reduce), so the prompt stays within SUMMARY_TOKEN_BUDGET.
+    A condenser that was fed the transcript while it was transcribed supplies the notes.
+    """
+    notes = condenser.notes() if condenser is not None else None
+    if notes is None:
+        compact = prompt_transcript(text)
+        if estimate_tokens(compact) <= SUMMARY_TOKEN_BUDGET:
+            yield from stream_summary(compact, context, language, client)
+            return
+        notes = condense_transcript(compact.splitlines(), client)
+    yield from stream_summary(notes, context, language, client)
+
+
+def summarize_text(text, context, language, client, condenser=None):
+    """
+    Streams the summary of a transcript, going through the shared summary cache.
+    A cached summary in the requested language is returned as is; one cached in another
+    language is translated; only otherwise, or if the translation lost or added chapter
+    headers, is the transcript summarized.
+    """
+    source_key = summary_source_key(transcript_digest(text), context)
+    cached = summary_cache.get(f"{source_key}:{language}")
+    if cached is not None:
+        yield cached
+        return
+
+    full_summary = None
+    languages = summary_cache.get(f"{source_key}:languages", [])
+    original = next(
+        (candidate for candidate in (summary_cache.get(f"{source_key}:{other}") for other in languages) if candidate),
+        None,
+    )
+    if original is not None:
+        # Buffered, so only the translation with the original timestamps is ever shown
+        translated = "".join(translate_summary(original, language, client))
+        full_summary = restore_chapter_timestamps(translated, original)
+        if full_summary is not None:
+            yield full_summary
+    if full_summary is None:
+        full_summary = ""
+        for token in generate_summary(text, context, language, client, condenser):
+            full_summary += token
+            yield token
+
+    # Only complete summaries with intact chapter headers get here
+    if full_summary:
+        summary_cache.set(f"{source_key}:{language}", full_summary)
+        summary_cache.set(f"{source_key}:languages", sorted(set(languages) | {language}))
 
@@ -0,0 +1,263 @@
+import bisect
+import re
+from array import array
+from hashlib import md5
+
+
+COMPACT_LINE_S = 30  # longest stretch of speech merged into one compact line
+COMPACT_LINE_CHARS = 400
+MIN_SENTENCE_CHARS = 60  # shorter sentences are merged with the next one
+OVERLAP_WORDS = 20  # how far back repeated auto-caption text is looked for
+
+# Non-speech tags ([Music], (applause)), speaker change markers and hesitation sounds
+NOISE_RE = re.compile(r"\[[^\]]*\]|\((?:music|applause|laughter|laughs|inaudible)\)|>>|♪", re.IGNORECASE)
+FILLER_RE = re.compile(r"\b(?:u+h+|u+m+|e+r+m+|h+m+)\b[,.]?", re.IGNORECASE)
+SENTENCE_END_RE = re.compile(r"[.!?…][\"')\]]*$")
+# SRT / WebVTT cue timing, "00:01:02,500 --> 00:01:04,000" (hours optional in WebVTT)
+CUE_TIME = r"(?:(\d+):)?(\d{1,2}):(\d{2})[,.](\d{1,3})"
+CUE_TIMING_RE = re.compile(rf"{CUE_TIME}\s*-->\s*{CUE_TIME}")
+SUBTITLE_TAG_RE = re.compile(r"<[^>]*>|\{\\[^}]*\}")  # <i>, <c.colour>, <00:01.000>, {\an8}
+
+
+def format_clock(seconds: float, separator: str = ",") -> str:
+    """
+    HH:MM:SS,mmm (SRT) or, with separator=".", HH:MM:SS.mmm (WebVTT).
+    """
+    total_ms = int(round(max(seconds, 0.0) * 1000))
+    hours, remainder = divmod(total_ms, 3600 * 1000)
+    minutes, remainder = divmod(remainder, 60 * 1000)
+    secs, milliseconds = divmod(remainder, 1000)
+    return f"{hours:02}:{minutes:02}:{secs:02}{separator}{milliseconds:03}"
+
+
+def clean_caption_text(text: str) -> str:
+    """
+    Caption text without non-speech tags and filler sounds, on one line.
+    """
+    text = FILLER_RE.sub("", NOISE_RE.sub(" ", text))
+    return " ".join(text.split())
+
+
+def drop_overlap(previous_words: list[str], words: list[str]) -> list[str]:
+    """
+    Removes the start of words that repeats the end of previous_words, as rolling
+    auto-captions do. Single repeated words are kept unless the whole fragment is repeated.
+    """
+    tail = [word.casefold() for word in previous_words[-OVERLAP_WORDS:]]
+    folded = [word.casefold() for word in words]
+    for k in range(min(len(tail), len(folded)), 0, -1):
+        if tail[-k:] == folded[:k] and (k >= 2 or k == len(folded)):
+            return words[k:]
+    return words
+
+
+def _cue_seconds(hours, minutes, seconds, fraction) -> float:
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(fraction.ljust(3, "0")) / 1000
+
+
+def format_mmss(seconds: float) -> str:
+    """
+    MM:SS as used in summaries and chapter headers (minutes keep counting past 60).
+    """
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{secs:02d}"
+
+
+class Transcript:
+    """
+    Timestamped transcript stored column-wise: start and end times in float arrays, and
+    the text of all segments in a single string with an offset array. SRT, WebVTT and
+    text renderings are produced on request instead of being kept alongside.
+    """
+
+    def __init__(self, starts=(), ends=(), texts=()):
+        self.starts = array("d", starts)
+        self.ends = array("d", ends)
+        texts = list(texts)
+        self.offsets = array("Q", [0])
+        for text in texts:
+            self.offsets.append(self.offsets[-1] + len(text))
+        self._text = "".join(texts)
+
+    @classmethod
+    def from_segments(cls, segments):
+        """
+        From dicts with "start", "end" and "text" (as produced by audio_utils.transcribe_segments).
+        """
+        segments = list(segments)
+        return cls(
+            (s["start"] for s in segments),
+            (s["end"] for s in segments),
+            (s["text"].strip() for s in segments),
+        )
+
+    @classmethod
+    def from_captions(cls, captions):
+        """
+        From youtube-transcript-api raw data: dicts with "start", "duration" and "text".
+        """
+        captions = list(captions)
+        return cls(
+            (c["start"] for c in captions),
+            (c["start"] + c["duration"] for c in captions),
+            (c["text"].strip() for c in captions),
+        )
+
+    @classmethod
+    def from_subtitles(cls, subtitles):
+        """
+        From an SRT or WebVTT file (str or bytes). Cue numbers, WebVTT headers, notes and
+        styles, formatting tags and non-speech tags are dropped; cues are sorted by start.
+        """
+        if isinstance(subtitles, bytes):
+            try:
+                subtitles = subtitles.decode("utf-8-sig")
+            except UnicodeDecodeError:
+                subtitles = subtitles.decode("cp1250", errors="replace")  # older Polish subtitle files
+        cues = []
+        for block in re.split(r"\n\s*\n", subtitles.replace("\r\n", "\n").replace("\r", "\n")):
+            lines = block.strip().split("\n")
+            timing = next((i for i, line in enumerate(lines) if CUE_TIMING_RE.search(line)), None)
+            if timing is None:
+                continue
+            times = CUE_TIMING_RE.search(lines[timing]).groups()
+            text = clean_caption_text(SUBTITLE_TAG_RE.sub("", " ".join(lines[timing + 1:])))
+            if text:
+                cues.append((_cue_seconds(*times[:4]), _cue_seconds(*times[4:]), text))
+        cues.sort(key=lambda cue: cue[0])
+        return cls(
+            (cue[0] for cue in cues),
+            (cue[1] for cue in cues),
+            (cue[2] for cue in cues),
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        return {"start": self.starts[i], "end": self.ends[i], "text": self.text(i)}
+
+    def __str__(self):
+        return self.to_timestamped_text()
+
+    def text(self, i):
+        return self._text[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def duration(self):
+        return max(self.ends) if len(self) else 0.0
+
+    def digest(self):
+        """
+        Content hash, stable across sessions (used for cache keys).
+        """
+        digest = md5(self.starts.tobytes())
+        digest.update(self.ends.tobytes())
+        digest.update(self._text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def gaps(self, duration, min_seconds=0.0):
+        """
+        (start, end) spans of the first duration seconds that no segment covers,
+        leaving out those shorter than min_seconds.
+        """
+        spans = []
+        covered = 0.0
+        for start, end in sorted(zip(self.starts, self.ends)):
+            if start - covered >= max(min_seconds, 1e-3):
+                spans.append((covered, start))
+            covered = max(covered, end)
+        if duration - covered >= max(min_seconds, 1e-3):
+            spans.append((covered, duration))
+        return spans
+
+    def index_range(self, start, end):
+        """
+        Indices [lo, hi) of the segments overlapping the [start, end) time range.
+        """
+        lo = bisect.bisect_left(self.starts, start)
+        # A segment starting before `start` may still reach into the range
+        while lo > 0 and self.ends[lo - 1] > start:
+            lo -= 1
+        hi = bisect.bisect_left(self.starts, end, lo)
+        return lo, hi
+
+    def slice(self, start, end):
+        """
+        Transcript of the segments overlapping [start, end) seconds.
+        """
+        lo, hi = self.index_range(start, end)
+        return Transcript(
+            self.starts[lo:hi],
+            self.ends[lo:hi],
+            (self.text(i) for i in range(lo, hi)),
+        )
+
+    def compact(self, max_seconds=COMPACT_LINE_S, max_chars=COMPACT_LINE_CHARS):
+        """
+        Transcript for prompts: fragments cleaned (clean_caption_text), repeated
+        auto-caption overlaps dropped, and merged into sentences of at least
+        MIN_SENTENCE_CHARS, or into windows of up to max_seconds / max_chars when the
+        captions have no punctuation. Each line keeps the start time of its first fragment.
+        """
+        starts, ends, texts = [], [], []
+        line = []
+        previous = []
+        for i in range(len(self)):
+            words = drop_overlap(previous, clean_caption_text(self.text(i)).split())
+            if not words:
+                continue
+            previous = (previous + words)[-OVERLAP_WORDS:]
+            if line and self.starts[i] - starts[-1] >= max_seconds:
+                texts.append(" ".join(line))
+                line = []
+            if not line:
+                starts.append(self.starts[i])
+                ends.append(self.ends[i])
+            line.extend(words)
+            ends[-1] = max(ends[-1], self.ends[i])
+            text = " ".join(line)
+            if (SENTENCE_END_RE.search(text) and len(text) >= MIN_SENTENCE_CHARS) or len(text) >= max_chars:
+                texts.append(text)
+                line = []
+        if line:
+            texts.append(" ".join(line))
+        return Transcript(starts, ends, texts)
+
+    def compact_lines(self):
+        """
+        "[MM:SS] text" per segment - start times only, which is all chapter timestamps need.
+        """
+        return [f"[{format_mmss(self.starts[i])}] {self.text(i)}" for i in range(len(self))]
+
+    def to_srt(self):
+        return "\n".join(
+            f"{i + 1}\n{format_clock(self.starts[i])} --> {format_clock(self.ends[i])}\n{self.text(i)}\n"
+            for i in range(len(self))
+        )
+
+    def to_vtt(self):
+        cues = (
+            f"{format_clock(self.starts[i], '.')} --> {format_clock(self.ends[i], '.')}\n{self.text(i)}\n"
+            for i in range(len(self))
+        )
+        return "WEBVTT\n\n" + "\n".join(cues)
+
+    def timestamped_lines(self):
+        return [
+            f"[{format_mmss(self.starts[i])} – {format_mmss(self.ends[i])}] {self.text(i)}"
+            for i in range(len(self))
+        ]
+
+    def to_timestamped_text(self):
+        return "\n".join(self.timestamped_lines())
+
+    def to_text(self):
+        return "\n".join(self.text(i) for i in range(len(self)))
@@ -8,9 +8,12 @@ TEXTS = {
         "chapters": "📚 Chapters",
         "video_error": "Video not found or private.",
         "no_captions": "No captions available for this video.",
-        "no_transcription_info": "As for now the application doesn't support direct audio transcription from Youtube. However, you can upload the video file in the 'Upload file' tab if you have it.",
+        "no_transcription_info": "The video audio can be transcribed instead. This takes longer and uses your OpenAI API credits.",
+        "transcribe_audio": "Transcribe audio",
         "send_file": "Send a file for transcription",
         "context": "You can add additional context for the summary here",
+        "send_subtitles": "Subtitles for the recording (optional) - only the parts they don't cover are transcribed",
+        "subtitles_error": "No subtitles found in this file.",
         "lang_info": "Summary will be generated in the language set while pressing the 'Generate Summary' button. You can always regenerate it in another language.",
         "loading": "Generating summary, please wait...",
         "input_label": "Input your link here:",
@@ -19,7 +22,16 @@ TEXTS = {
         "transcribing_info": "Transcribing audio... (this may take a while depending on the length)",
         "summarizing_info": "Transcription completed. Generating summary...",
         "summary_completed": "Summary generation completed.",
+        "search_transcript": "Search the transcript",
+        "no_search_results": "No matches in the transcript.",
+        "transcription_incomplete": "Transcribed {done} of {total} parts of the audio, the rest failed. The finished parts are saved, so trying again only transcribes the missing ones.",
+        "retry_transcription": "Try again",
         "transcript_error": "Unfortunately, your IP address has been temporarily blocked by YouTube for making too many requests. Please try again later or use a different network.",
+        "transcribing_chunk": "Transcribing audio... (part {done} of {total})",
+        "shared_job": "Shared with {count} other request(s) for the same content.",
+        "queued_requests": "OpenAI requests waiting for a rate limit slot: {count}",
+        "show_metrics": "Show metrics",
+        "no_metrics": "No stages recorded in this session yet.",
     },
     "polish": {
         "title": "Witamy",
@@ -29,9 +41,12 @@ TEXTS = {
         "chapters": "📚 Rozdziały",
         "video_error": "Wideo nie znalezione lub prywatne.",
         "no_captions": "Brak dostępnych napisów dla tego wideo.",
-        "no_transcription_info": "Obecnie aplikacja nie obsługuje bezpośredniej transkrypcji audio z YouTube. Możesz jednak przesłać plik wideo w zakładce 'Prześlij plik', jeśli go posiadasz.",
+        "no_transcription_info": "Zamiast tego można wykonać transkrypcję audio z wideo. Trwa to dłużej i zużywa środki z Twojego klucza API OpenAI.",
+        "transcribe_audio": "Transkrybuj audio",
         "send_file": "Prześlij plik do transkrypcji",
         "context": "Możesz dodać dodatkowy kontekst do podsumowania tutaj",
+        "send_subtitles": "Napisy do nagrania (opcjonalnie) - transkrybowane są tylko fragmenty bez napisów",
+        "subtitles_error": "Nie znaleziono napisów w tym pliku.",
         "lang_info": "Podsumowanie zostanie wygenerowane w języku ustawionym podczas naciskania przycisku 'Wygeneruj podsumowanie'. Zawsze możesz wygenerować je ponownie w innym języku.",
         "loading": "Generowanie podsumowania, proszę czekać...",
         "input_label": "Wprowadź swój link:",
@@ -40,7 +55,16 @@ TEXTS = {
         "transcribing_info": "Transkrypcja audio... (to może potrwać w zależności od długości)",
         "summarizing_info": "Transkrypcja zakończona. Generowanie podsumowania...",
         "summary_completed": "Generowanie podsumowania zakończone.",
+        "search_transcript": "Szukaj w transkrypcji",
+        "no_search_results": "Brak wyników w transkrypcji.",
+        "transcription_incomplete": "Przetranskrybowano {done} z {total} części nagrania, pozostałe się nie powiodły. Gotowe części są zapisane, więc ponowna próba przetranskrybuje tylko brakujące.",
+        "retry_transcription": "Spróbuj ponownie",
         "transcript_error": "Niestety, Twój adres IP został tymczasowo zablokowany przez YouTube za zbyt wiele żądań. Spróbuj ponownie później lub użyj innej sieci.",
+        "transcribing_chunk": "Transkrypcja audio... (część {done} z {total})",
+        "shared_job": "Wspólne z innymi żądaniami o tę samą treść: {count}.",
+        "queued_requests": "Żądania OpenAI czekające na wolne miejsce w limicie: {count}",
+        "show_metrics": "Pokaż metryki",
+        "no_metrics": "Brak zarejestrowanych etapów w tej sesji.",
     },
 }
 
@@ -10,7 +10,11 @@ from youtube_transcript_api._errors import (
     RequestBlocked
 )
 import requests
-import tempfile
+import os
+import threading
+
+import metrics
+from cache_utils import DiskCache, MISSING
 
 
 ydl_opts = {
@@ -19,11 +23,30 @@ ydl_opts = {
     "quiet": True,
 }
 
+YOUTUBE_CACHE_TTL = 6 * 60 * 60  # seconds
+YOUTUBE_NEGATIVE_CACHE_TTL = 10 * 60  # missing/private videos and videos without captions
+YOUTUBE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# Shared by every session, keyed by video ID
+youtube_cache = DiskCache("youtube", max_bytes=YOUTUBE_CACHE_MAX_BYTES)
+
 
 def video_exists_http(video_id):
-    url = f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}"
-    r = requests.get(url)
-    return r.status_code == 200
+    if not video_id:
+        return False
+    cache_key = f"exists:{video_id}"
+    with youtube_cache.fill_lock(cache_key):
+        exists = youtube_cache.get(cache_key, MISSING)
+        if exists is MISSING:
+            url = f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}"
+            with metrics.stage("video_exists") as record:
+                r = requests.get(url, timeout=10)
+                record["status"] = r.status_code
+            exists = r.status_code == 200
+            # Only cache definite answers - throttling or server errors say nothing about the video
+            if exists or r.status_code in (400, 401, 403, 404):
+                youtube_cache.set(cache_key, exists, ttl=YOUTUBE_CACHE_TTL if exists else YOUTUBE_NEGATIVE_CACHE_TTL)
+    return exists
 
 
 def get_youtube_id(url:str) -> str | None:
@@ -73,55 +96,124 @@ def fetch_youtube_captions(
     ) -> dict:
     """
     Fetch YouTube captions using youtube-transcript-api >=1.0.0
+    Results (including "no captions") are cached per video ID; RequestBlocked is never cached.
     """
-    ytt_api = YouTubeTranscriptApi()
-    try:
-        fetched_transcript = ytt_api.fetch(youtube_id).to_raw_data()
-    except NoTranscriptFound:
-        fetched_transcript = None
+    cache_key = f"captions:{youtube_id}"
+    # Sessions asking for the same video at once share one request
+    with youtube_cache.fill_lock(cache_key):
+        fetched_transcript = youtube_cache.get(cache_key, MISSING)
+        if fetched_transcript is not MISSING:
+            return fetched_transcript
+
+        ytt_api = YouTubeTranscriptApi()
+        try:
+            with metrics.stage("captions_fetch"):
+                fetched_transcript = ytt_api.fetch(youtube_id).to_raw_data()
+        except (NoTranscriptFound, TranscriptsDisabled, VideoUnavailable):
+            fetched_transcript = None
+        youtube_cache.set(
+            cache_key,
+            fetched_transcript,
+            ttl=YOUTUBE_CACHE_TTL if fetched_transcript is not None else YOUTUBE_NEGATIVE_CACHE_TTL,
+        )
     return fetched_transcript
 
  
 
-def download_youtube_audio(url: str) -> bytes:
+class AudioDownload:
     """
-    Pobiera audio z YouTube do bytes.
-    - Nie używa postprocessingu, żeby uniknąć błędów FFmpeg w pamięci.
-    - Zwraca oryginalny audio format (webm/m4a), gotowy do Whisper.
+    Downloads the audio of a video straight to a file in out_dir on a background thread.
+    The file is written in place (no .part file), so it can be read while it grows;
+    progress is tracked from yt_dlp's progress hooks.
     """
-    ydl_opts = {
-        "format": "bestaudio/best",
-        "quiet": True,
-        "noplaylist": True,
-        "postprocessors": [],  # brak konwersji → brak problemów z FFmpeg
-    }
-
-    with tempfile.NamedTemporaryFile(suffix=".audio") as tmp_file:
-        ydl_opts["outtmpl"] = tmp_file.name
+
+    def __init__(self, url: str, out_dir: str):
+        self.url = url
+        self.out_dir = out_dir
+        self.path = None
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self.error = None
+        self.done = threading.Event()
+        self._thread = threading.Thread(target=metrics.bind(self._run), daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait(self):
+        self.done.wait()
+        if self.error:
+            raise self.error
+        return self.path
+
+    def fraction(self) -> float:
+        """
+        Downloaded share of the file (1.0 once finished, 0.0 while the size is unknown).
+        """
+        if self.done.is_set():
+            return 1.0
+        if not self.total_bytes:
+            return 0.0
+        return min(1.0, self.downloaded_bytes / self.total_bytes)
+
+    def _hook(self, d):
+        self.path = d.get("filename") or self.path
+        self.downloaded_bytes = d.get("downloaded_bytes") or self.downloaded_bytes
+        self.total_bytes = d.get("total_bytes") or d.get("total_bytes_estimate") or self.total_bytes
+
+    def _run(self):
+        ydl_opts = {
+            # Stream formats the API accepts as they are, so chunks can be stream-copied
+            "format": "bestaudio[ext=webm]/bestaudio[ext=m4a]/bestaudio/best",
+            "quiet": True,
+            "noplaylist": True,
+            "nopart": True,
+            "overwrites": True,
+            "outtmpl": os.path.join(self.out_dir, "audio.%(ext)s"),
+            "postprocessors": [],  # brak konwersji → brak problemów z FFmpeg
+            "progress_hooks": [self._hook],
+        }
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-        except yt_dlp.utils.DownloadError as e:
-            print(f"Download failed: {e}")
-            return None
+            with metrics.stage("download") as record, yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([self.url])
+                record["bytes_out"] = self.downloaded_bytes
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
 
-        tmp_file.seek(0)
-        return tmp_file.read()
+def download_youtube_audio(url: str, out_dir: str) -> str:
+    """
+    Pobiera audio z YouTube do pliku w out_dir i zwraca jego ścieżkę.
+    - Nie używa postprocessingu, żeby uniknąć błędów FFmpeg.
+    - Zwraca oryginalny audio format (webm/m4a), gotowy do Whisper.
+    """
+    return AudioDownload(url, out_dir).start().wait()
 
 def fetch_youtube_metadata(url: str) -> dict:
-    ydl_opts = {
-        "quiet": True,
-        "skip_download": True,
-    }
-
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=False)
-
-    return {
-        "title": info.get("title"),
-        "description": info.get("description"),
-        "channel": info.get("channel"),
-        "upload_date": info.get("upload_date"),
-        "duration": info.get("duration"),
-        "tags": info.get("tags"),
-    }
+    cache_key = f"metadata:{get_youtube_id(url) or url}"
+    with youtube_cache.fill_lock(cache_key):
+        metadata = youtube_cache.get(cache_key)
+        if metadata is not None:
+            return metadata
+
+        ydl_opts = {
+            "quiet": True,
+            "skip_download": True,
+        }
+
+        with metrics.stage("metadata_fetch"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+
+        metadata = {
+            "title": info.get("title"),
+            "description": info.get("description"),
+            "channel": info.get("channel"),
+            "upload_date": info.get("upload_date"),
+            "duration": info.get("duration"),
+            "tags": info.get("tags"),
+        }
+        youtube_cache.set(cache_key, metadata, ttl=YOUTUBE_CACHE_TTL)
+    return metadata